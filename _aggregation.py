@@ -0,0 +1,88 @@
+"""
+Hierarchical aggregation of IAMC variables along their "|"-delimited tree.
+
+Parents are computed bottom-up as the sum of their children, one groupby per
+tree level. Missing parents are filled in, parents which a getter computed
+differently are kept and compared with the sum of their children.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Children which are not part of their parent's total, e.g. storage
+# converters are not counted in Capacity|Electricity, and alternative
+# groupings like Fossil overlap with Coal, Gas and Oil
+NON_ADDITIVE = {
+    "Storage Converter",
+    "Storage Reservoir",
+    "Reservoir",
+    "Curtailment",
+    "Storage Losses",
+    "Transmission Losses",
+    "Fossil",
+    "Non-Biomass Renewables",
+}
+
+# Only these children are summed if a parent has them, e.g. Gas|CC and
+# Gas|OC are a further split of Gas|w/o CCS
+CCS = {"w/ CCS", "w/o CCS"}
+
+# Parents whose children do not cover everything they include, so that the
+# sum of the children is neither filled in nor compared
+PARTIAL = {
+    "Primary Energy|Oil",
+    "Primary Energy|Gas",
+    "Primary Energy|Coal",
+    "Primary Energy|Biomass",
+}
+
+
+def _split(variables):
+    parts = variables.str.rsplit("|", n=1)
+    return parts.str[0], parts.str[-1]
+
+
+def aggregate(var, report=None, rtol=1e-5, atol=1e-9):
+    """
+    Fill in the missing parents of the variables in `var` (a Series, or a
+    DataFrame Variable x Region) bottom-up from their children.
+
+    Parents which already exist are compared with the sum of their
+    children. If `report` is a list, a DataFrame with the inconsistent
+    parents (Variable, Region, reported, aggregated) is appended to it.
+    Top-level names like "Capacity" are never created.
+    """
+    is_series = isinstance(var, pd.Series)
+    frame = var.to_frame() if is_series else var
+
+    depth = frame.index.str.count(r"\|")
+    for level in range(depth.max() if len(depth) else 0, 1, -1):
+        children = frame[frame.index.str.count(r"\|") == level]
+        parents, leaves = _split(children.index)
+        has_ccs = parents.isin(parents[leaves.isin(CCS)])
+        summed = (
+            ~leaves.isin(NON_ADDITIVE)
+            & ~parents.isin(PARTIAL)
+            & (leaves.isin(CCS) | ~has_ccs)
+        )
+        sums = children[summed].groupby(parents[summed], sort=False).sum()
+
+        missing = sums.index.difference(frame.index, sort=False)
+        frame = pd.concat([frame, sums.loc[missing]])
+
+        existing = sums.index.intersection(frame.index, sort=False)
+        if report is not None and not existing.empty:
+            reported = frame.loc[existing, sums.columns].astype(float)
+            aggregated = sums.loc[existing]
+            inconsistent = ~np.isclose(
+                reported, aggregated, rtol=rtol, atol=atol, equal_nan=True,
+            )
+            rows, cols = np.nonzero(inconsistent)
+            report.append(pd.DataFrame({
+                "Variable": existing[rows],
+                "Region": sums.columns[cols],
+                "reported": reported.values[rows, cols],
+                "aggregated": aggregated.values[rows, cols],
+            }))
+
+    return frame.iloc[:, 0].rename(var.name) if is_series else frame
@@ -0,0 +1,179 @@
+import inspect
+import json
+import os
+import pickle
+from hashlib import sha256
+from pathlib import Path
+
+import pandas as pd
+import pypsa
+
+import _aggregation
+import _carriers
+import _network
+import _registry
+import _statistics
+import _utils
+import _validation
+
+
+def file_digest(path):
+    """
+    Content hash of the file at `path`.
+
+    Hashing a 10 GB postnetwork takes a while, so the digest is remembered
+    in `<file>.sha256` next to the file per size and mtime and only
+    recomputed if the file changed. Each file has its own memo, such that
+    workers hashing different networks never write the same file.
+    """
+    path = Path(path)
+    memo = path.with_name(f"{path.name}.sha256")
+    stat = os.stat(path)
+    key = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    try:
+        with open(memo) as f:
+            known = json.load(f)
+        if all(known[k] == v for k, v in key.items()):
+            return known["digest"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    digest = sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 24), b""):
+            digest.update(chunk)
+    tmp = memo.with_name(f"{memo.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump({**key, "digest": digest.hexdigest()}, f)
+    os.replace(tmp, memo)
+    return digest.hexdigest()
+
+
+def load_parsed(path, parse, label):
+    """
+    `parse(path)`, a DataFrame, pickled next to the file at `path` and read
+    from there as long as the file does not change. `label` distinguishes
+    several parsed versions of one file, e.g. a sheet or a unit.
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        digest = sha256(f.read()).hexdigest()
+    cached = path.with_name(f".{path.stem}.{label}.{digest[:16]}.pkl")
+    try:
+        return pd.read_pickle(cached)
+    except FileNotFoundError:
+        pass
+
+    parsed = parse(path)
+    # Written under a name of its own, such that other workers never read a
+    # partial pickle
+    tmp = cached.with_suffix(f".{os.getpid()}.tmp")
+    parsed.to_pickle(tmp)
+    os.replace(tmp, cached)
+    return parsed
+
+
+def load_template(path, sheet_name="variable_definitions"):
+    """
+    The variable definitions of the IAMC template at `path` (an .xlsx file),
+    indexed by Variable, with all columns of the sheet (Unit, Definition,
+    ...).
+
+    Parsing the xlsx with openpyxl takes several seconds, so the parsed
+    table is cached (see `load_parsed`).
+    """
+    return load_parsed(
+        path,
+        lambda path: pd.read_excel(
+            path, sheet_name=sheet_name, index_col="Variable",
+        ),
+        sheet_name,
+    )
+
+
+def frame_digest(df):
+    # Hash of the values and index of a DataFrame or Series
+    return sha256(
+        pd.util.hash_pandas_object(df).values.tobytes()
+        + str(list(getattr(df, "columns", []))).encode()
+    ).hexdigest()
+
+
+def getter_digest(getter):
+    # A getter has to be recomputed when its code, the code of the helpers,
+    # carrier categories, registry, aggregation, inputs, network loading and
+    # checks it uses, or the PyPSA version changes
+    import _inputs  # imports load_parsed from this module
+    return sha256("\n".join([
+        inspect.getsource(getter),
+        inspect.getsource(_aggregation),
+        inspect.getsource(_carriers),
+        inspect.getsource(_inputs),
+        inspect.getsource(_network),
+        inspect.getsource(_registry),
+        inspect.getsource(_utils),
+        inspect.getsource(_statistics),
+        inspect.getsource(_validation),
+        pypsa.__version__,
+    ]).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent cache of getter results in `directory`.
+
+    Entries are pickled Series, addressed by a hash of everything the result
+    depends on (see `key`). Reading an entry updates its mtime, and after
+    every write the least recently used entries are deleted until the cache
+    is smaller than `max_size` bytes. Several processes may share one cache.
+    """
+
+    def __init__(self, directory, max_size=2**30):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts):
+        return sha256("\0".join(map(str, parts)).encode()).hexdigest()
+
+    def get(self, key):
+        path = self.directory / f"{key}.pkl"
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        path = self.directory / f"{key}.pkl"
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(result, f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries, key=lambda e: e[0]):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+
+    def summary(self):
+        return f"Result cache: {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,113 @@
+"""
+Classification of carriers into technology and sector categories.
+
+All substring patterns the getters and the registry select carriers by are
+defined in CATEGORIES. They are compiled once, and every carrier of a
+network is classified once, such that a selection like "all gas boilers" is
+a lookup of a boolean column instead of a string search on every call.
+"""
+import re
+from weakref import WeakKeyDictionary
+
+import pandas as pd
+
+
+# Category name -> regular expression, searched anywhere in the carrier name
+CATEGORIES = {
+    # Electricity
+    "wind": "wind",
+    "offwind": "offwind",
+    "solar": "solar",
+    "nuclear": "nuclear",
+    # Heat
+    "solar thermal": "solar thermal",
+    "boiler": "boiler",
+    "oil boiler": "oil boiler",
+    "gas boiler": "gas boiler",
+    "biomass boiler": "biomass boiler",
+    "heat pump": "heat pump",
+    "resistive heater": "resistive heater",
+    "water tanks": "water tanks",
+    "water tanks discharger": "water tanks discharger",
+    # Fuels
+    "gas": "gas",
+    "gas CHP": "gas CHP",
+    "gas for industry": "gas for industry",
+    "biomass": "biomass",
+    "solid biomass": "solid biomass",
+    "solid biomass for industry": "solid biomass for industry",
+    "biogas to gas": "biogas to gas",
+    "SMR": "SMR",
+    "CHP": "CHP",
+    # Carbon capture, note that this matches CCGT as well
+    "CC": "CC",
+    # Storage
+    "charger": "charger",
+    "discharger": "discharger",
+    "electricity storage": "PHS|battery discharger|home battery discharger|V2G",
+    # Sectors at the low voltage bus other than residential and commercial
+    "other sectors": "urban central|industry|agriculture",
+}
+
+_PATTERNS = {
+    category: re.compile(pattern) for category, pattern in CATEGORIES.items()
+}
+
+
+def classify(carriers):
+    # Boolean DataFrame carrier x category
+    carriers = pd.Index(carriers, dtype=object).unique()
+    return pd.DataFrame(
+        {
+            category: [pattern.search(c) is not None for c in carriers]
+            for category, pattern in _PATTERNS.items()
+        },
+        index=carriers,
+        dtype=bool,
+    )
+
+
+def get_carrier_categories(n):
+    """
+    Categories of all carriers of the components of `n`, as a boolean
+    DataFrame carrier x category, computed once per network.
+    """
+    if n in _categories:
+        return _categories[n]
+
+    carriers = pd.Index(sorted({
+        carrier
+        for c in n.branch_components | n.one_port_components
+        if "carrier" in n.df(c)
+        for carrier in n.df(c).carrier.unique()
+    }), dtype=object)
+    _categories[n] = classify(carriers)
+    return _categories[n]
+
+_categories = WeakKeyDictionary()
+
+
+def in_category(n, carriers, category):
+    """
+    Boolean mask of the carriers (e.g. the index of a statistic grouped by
+    carrier) which belong to `category`.
+    """
+    categories = get_carrier_categories(n)
+    missing = pd.Index(carriers, dtype=object).difference(categories.index)
+    if not missing.empty:
+        # e.g. carriers which are only bus carriers
+        categories = _categories[n] = pd.concat([
+            categories, classify(missing),
+        ])
+    return categories[category].reindex(carriers).to_numpy(dtype=bool)
+
+
+def select(n, values, category):
+    # Like `values.filter(like=category)` for values indexed by carrier
+    return values[in_category(n, values.index, category)]
+
+
+def get_carriers(n, category, c="Link"):
+    # Carriers of the component `c` in `category`
+    carriers = n.df(c).carrier.unique()
+    return carriers[in_category(n, carriers, category)].tolist()
@@ -1,37 +1,43 @@
 from _utils import *
+from _statistics import CachedStatistics
+from _registry import get_registered
+from _aggregation import aggregate
+from _carriers import get_carriers, in_category, select
+from _inputs import get_regional_industry_demand
+from _validation import Validator
 import pandas as pd
-from numpy import isclose
 
 MWh2GJ = 3.6
 TWh2PJ = 3.6
 MWh2PJ = 3.6e-6
 
-#n.statistics.withdrawal(bus_carrier="land transport oil", groupby=groupby, aggregate_time=False).filter(like="DE1 0",axis=0)
+#stats.withdrawal(bus_carrier="land transport oil", groupby=groupby, aggregate_time=False).filter(like="DE1 0",axis=0)
 
 
 
-def get_capacities_electricity(n, region):
+def get_capacities_electricity(n, region, stats=None, checks=None):
+    if stats is None:
+        stats = CachedStatistics(n)
+    if checks is None:
+        checks = Validator(strict=True)
 
     kwargs = {
         'groupby': n.statistics.groupers.get_name_bus_and_carrier,
         'nice_names': False,
     }
 
-    var = pd.Series()
-
-    capacities_electricity = n.statistics.optimal_capacity(
+    capacities_electricity = stats.optimal_capacity(
         bus_carrier=["AC", "low voltage"],
+        region=region,
         **kwargs,
-    ).filter(like=region).groupby("carrier").sum().drop( 
+    ).groupby("carrier").sum().drop( 
         # transmission capacities
         ["AC", "DC", "electricity distribution grid"],
+        errors="ignore",
     ).multiply(MW2GW)
 
-    var["Capacity|Electricity|Biomass|w/ CCS"] = \
-        capacities_electricity.get('urban central solid biomass CHP CC')
-    
-    var["Capacity|Electricity|Biomass|w/o CCS"] = \
-        capacities_electricity.get('urban central solid biomass CHP')
+    # Technologies, see _registry.py
+    var = get_registered(stats, region, "Capacity|Electricity|")
 
     var["Capacity|Electricity|Biomass|Solids"] = \
         var[[
@@ -40,19 +46,13 @@ def get_capacities_electricity(n, region):
         ]].sum()
 
     # Ariadne does no checks, so we implement our own?
-    assert var["Capacity|Electricity|Biomass|Solids"] == \
-        capacities_electricity.filter(like="solid biomass").sum()
-
-    var["Capacity|Electricity|Biomass"] = \
-        var["Capacity|Electricity|Biomass|Solids"]
-
+    checks.isclose(
+        "Capacity|Electricity|Biomass|Solids",
+        var["Capacity|Electricity|Biomass|Solids"],
+        select(n, capacities_electricity, "solid biomass").sum(),
+    )
 
-    var["Capacity|Electricity|Coal|Hard Coal"] = \
-        capacities_electricity.get('coal', 0)                                              
 
-    var["Capacity|Electricity|Coal|Lignite"] = \
-        capacities_electricity.get('lignite', 0)
-    
     # var["Capacity|Electricity|Coal|Hard Coal|w/ CCS"] = 
     # var["Capacity|Electricity|Coal|Hard Coal|w/o CCS"] = 
     # var["Capacity|Electricity|Coal|Lignite|w/ CCS"] = 
@@ -64,49 +64,13 @@ def get_capacities_electricity(n, region):
     # > config: coal_cc
 
 
-    var["Capacity|Electricity|Coal"] = \
-        var[[
-            "Capacity|Electricity|Coal|Lignite",
-            "Capacity|Electricity|Coal|Hard Coal",
-        ]].sum()
-
     # var["Capacity|Electricity|Gas|CC|w/ CCS"] =
     # var["Capacity|Electricity|Gas|CC|w/o CCS"] =  
     # ! Not implemented, rarely used   
 
-    var["Capacity|Electricity|Gas|CC"] = \
-        capacities_electricity.get('CCGT')
-    
-    var["Capacity|Electricity|Gas|OC"] = \
-        capacities_electricity.get('OCGT')
-    
-    var["Capacity|Electricity|Gas|w/ CCS"] =  \
-        capacities_electricity.get('urban central gas CHP CC')  
-    
-    var["Capacity|Electricity|Gas|w/o CCS"] =  \
-        capacities_electricity.get('urban central gas CHP') + \
-        var[[
-            "Capacity|Electricity|Gas|CC",
-            "Capacity|Electricity|Gas|OC",
-        ]].sum()
-    
-
-    var["Capacity|Electricity|Gas"] = \
-        var[[
-            "Capacity|Electricity|Gas|w/ CCS",
-            "Capacity|Electricity|Gas|w/o CCS",
-        ]].sum()
 
     # var["Capacity|Electricity|Geothermal"] = 
     # ! Not implemented
-
-    var["Capacity|Electricity|Hydro"] = \
-        pd.Series({
-            c: capacities_electricity.get(c) 
-            for c in ["ror", "hydro"]
-        }).sum()
-    # Q!: Not counting PHS here, because it is a true storage,
-    # as opposed to hydro
      
     # var["Capacity|Electricity|Hydrogen|CC"] = 
     # ! Not implemented
@@ -114,18 +78,10 @@ def get_capacities_electricity(n, region):
     # Q: "H2-turbine"
     # Q: What about retrofitted gas power plants? -> Lisa
 
-    var["Capacity|Electricity|Hydrogen|FC"] = \
-        capacities_electricity.get("H2 Fuel Cell")
-
-    var["Capacity|Electricity|Hydrogen"] = \
-        var["Capacity|Electricity|Hydrogen|FC"]
 
     # var["Capacity|Electricity|Non-Renewable Waste"] = 
     # ! Not implemented
 
-    var["Capacity|Electricity|Nuclear"] = \
-        capacities_electricity.get("nuclear", 0)
-
     # var["Capacity|Electricity|Ocean"] = 
     # ! Not implemented
 
@@ -133,115 +89,29 @@ def get_capacities_electricity(n, region):
     # var["Capacity|Electricity|Oil|w/o CCS"] = 
     # ! Not implemented
 
-    var["Capacity|Electricity|Oil"] = \
-        capacities_electricity.get("oil")
-
-
-    var["Capacity|Electricity|Solar|PV|Rooftop"] = \
-        capacities_electricity.get("solar rooftop")
-    
-    var["Capacity|Electricity|Solar|PV|Open Field"] = \
-        capacities_electricity.get("solar") 
-
-    var["Capacity|Electricity|Solar|PV"] = \
-        var[[
-            "Capacity|Electricity|Solar|PV|Open Field",
-            "Capacity|Electricity|Solar|PV|Rooftop",
-        ]].sum()
     
     # var["Capacity|Electricity|Solar|CSP"] = 
     # ! not implemented
 
-    var["Capacity|Electricity|Solar"] = \
-        var["Capacity|Electricity|Solar|PV"]
-    
-    var["Capacity|Electricity|Wind|Offshore"] = \
-        capacities_electricity.get(
-            ["offwind", "offwind-ac", "offwind-dc"]
-        ).sum()
-    # !: take care of "offwind" -> "offwind-ac"/"offwind-dc"
-
-    var["Capacity|Electricity|Wind|Onshore"] = \
-        capacities_electricity.get("onwind")
-    
-    var["Capacity|Electricity|Wind"] = \
-        capacities_electricity.filter(like="wind").sum()
     
-    assert var["Capacity|Electricity|Wind"] == \
-        var[[
-            "Capacity|Electricity|Wind|Offshore",
-            "Capacity|Electricity|Wind|Onshore",
-        ]].sum()
-
 
     # var["Capacity|Electricity|Storage Converter|CAES"] = 
     # ! Not implemented
-
-    var["Capacity|Electricity|Storage Converter|Hydro Dam Reservoir"] = \
-        capacities_electricity.get('hydro')
-    
-    var["Capacity|Electricity|Storage Converter|Pump Hydro"] = \
-        capacities_electricity.get('PHS')
-
-    var["Capacity|Electricity|Storage Converter|Stationary Batteries"] = \
-        capacities_electricity.get("battery discharger") + \
-        capacities_electricity.get("home battery discharger")
-
-    var["Capacity|Electricity|Storage Converter|Vehicles"] = \
-        capacities_electricity.get("V2G", 0)
-    
-    var["Capacity|Electricity|Storage Converter"] = \
-        var[[
-            "Capacity|Electricity|Storage Converter|Hydro Dam Reservoir",
-            "Capacity|Electricity|Storage Converter|Pump Hydro",
-            "Capacity|Electricity|Storage Converter|Stationary Batteries",
-            "Capacity|Electricity|Storage Converter|Vehicles",
-        ]].sum()
     
 
-    storage_capacities = n.statistics.optimal_capacity(
-        storage=True,
-        **kwargs,
-    ).filter(like=region).groupby("carrier").sum().multiply(MW2GW)
     # var["Capacity|Electricity|Storage Reservoir|CAES"] =
     # ! Not implemented
-     
-    var["Capacity|Electricity|Storage Reservoir|Hydro Dam Reservoir"] = \
-        storage_capacities.get("hydro")
 
-    var["Capacity|Electricity|Storage Reservoir|Pump Hydro"] = \
-        storage_capacities.get("PHS")
-    
-    var["Capacity|Electricity|Storage Reservoir|Stationary Batteries"] = \
-        pd.Series({
-            c: storage_capacities.get(c) 
-            for c in ["battery", "home battery"]
-        }).sum()
-    
-    var["Capacity|Electricity|Storage Reservoir|Vehicles"] = \
-        storage_capacities.get("Li ion", 0) 
 
-    var["Capacity|Electricity|Storage Reservoir"] = \
-        var[[
-            "Capacity|Electricity|Storage Reservoir|Hydro Dam Reservoir",
-            "Capacity|Electricity|Storage Reservoir|Pump Hydro",
-            "Capacity|Electricity|Storage Reservoir|Stationary Batteries",
-            "Capacity|Electricity|Storage Reservoir|Vehicles",
-        ]].sum()
 
+    # Parents, e.g. Capacity|Electricity|Coal, see _aggregation.py
+    var = aggregate(var)
 
-    var["Capacity|Electricity"] = \
-            var[[
-            "Capacity|Electricity|Wind",
-            "Capacity|Electricity|Solar",
-            "Capacity|Electricity|Oil",
-            "Capacity|Electricity|Coal",
-            "Capacity|Electricity|Gas",
-            "Capacity|Electricity|Biomass",
-            "Capacity|Electricity|Hydro",
-            "Capacity|Electricity|Hydrogen",
-            "Capacity|Electricity|Nuclear",
-            ]].sum()
+    checks.isclose(
+        "Capacity|Electricity|Wind",
+        var["Capacity|Electricity|Wind"],
+        select(n, capacities_electricity, "wind").sum(),
+    )
 
     # Test if we forgot something
     _drop_idx = [
@@ -252,36 +122,41 @@ def get_capacities_electricity(n, region):
             "V2G",
         ] if col in capacities_electricity.index
     ]
-    assert isclose(
+    checks.isclose(
+        "Capacity|Electricity",
         var["Capacity|Electricity"],
         capacities_electricity.drop(_drop_idx).sum(),
     )
     
     return var
 
-def get_capacities_heat(n, region):
+def get_capacities_heat(n, region, stats=None, checks=None):
+    if stats is None:
+        stats = CachedStatistics(n)
+    if checks is None:
+        checks = Validator(strict=True)
 
     kwargs = {
         'groupby': n.statistics.groupers.get_name_bus_and_carrier,
         'nice_names': False,
     }
 
-    var = pd.Series()
-
-    capacities_heat = n.statistics.optimal_capacity(
+    capacities_heat = stats.optimal_capacity(
         bus_carrier=[
             "urban central heat",
             "urban decentral heat",
             "rural heat"
         ],
+        region=region,
         **kwargs,
-    ).filter(like=region).groupby("carrier").sum().drop(
-        ["urban central heat vent"]
+    ).groupby("carrier").sum().drop(
+        ["urban central heat vent"],
+        errors="ignore",
     ).multiply(MW2GW)
 
+    # Technologies, see _registry.py
+    var = get_registered(stats, region, "Capacity|Heat|")
 
-    var["Capacity|Heat|Solar thermal"] = \
-        capacities_heat.filter(like="solar thermal").sum()
     # TODO Ariadne DB distinguishes between Heat and Decentral Heat!
     # We should probably change all capacities here?!
 
@@ -289,59 +164,20 @@ def get_capacities_heat(n, region):
     #  We could be much more detailed for the heat sector (as for electricity)
     # if desired by Ariadne
     #
-    var["Capacity|Heat|Biomass|w/ CCS"] = \
-        capacities_heat.get('urban central solid biomass CHP CC') 
-    var["Capacity|Heat|Biomass|w/o CCS"] = \
-        capacities_heat.get('urban central solid biomass CHP') \
-        +  capacities_heat.filter(like="biomass boiler").sum()
-    
-    var["Capacity|Heat|Biomass"] = \
-        var["Capacity|Heat|Biomass|w/ CCS"] + \
-        var["Capacity|Heat|Biomass|w/o CCS"]
+    # Parents, see _aggregation.py
+    var = aggregate(var)
 
-    assert isclose(
+    checks.isclose(
+        "Capacity|Heat|Biomass",
         var["Capacity|Heat|Biomass"],
-        capacities_heat.filter(like="biomass").sum()
+        select(n, capacities_heat, "biomass").sum()
     )
-    
-    var["Capacity|Heat|Resistive heater"] = \
-        capacities_heat.filter(like="resistive heater").sum()
-    
-    var["Capacity|Heat|Processes"] = \
-        pd.Series({c: capacities_heat.get(c) for c in [
-                "Fischer-Tropsch",
-                "H2 Electrolysis",
-                "H2 Fuel Cell",
-                "Sabatier",
-                "methanolisation",
-        ]}).sum()
 
     # !!! Missing in the Ariadne database
 
-    var["Capacity|Heat|Gas"] = \
-        capacities_heat.filter(like="gas boiler").sum() \
-        + capacities_heat.filter(like="gas CHP").sum()
-    
     # var["Capacity|Heat|Geothermal"] =
     # ! Not implemented 
 
-    var["Capacity|Heat|Heat pump"] = \
-        capacities_heat.filter(like="heat pump").sum()
-
-    var["Capacity|Heat|Oil"] = \
-        capacities_heat.filter(like="oil boiler").sum()
-
-    var["Capacity|Heat|Storage Converter"] = \
-        capacities_heat.filter(like="water tanks discharger").sum()
-
-    storage_capacities = n.statistics.optimal_capacity(
-        storage=True,
-        **kwargs,
-    ).filter(like=region).groupby("carrier").sum().multiply(MW2GW)
-
-    var["Capacity|Heat|Storage Reservoir"] = \
-        storage_capacities.filter(like="water tanks").sum()
-
     # Q: New technologies get added as we develop the model.
     # It would be helpful to have some double-checking, e.g.,
     # by asserting that every technology gets added,
@@ -349,64 +185,52 @@ def get_capacities_heat(n, region):
     # and summing the subcategories to compare to the total
     # !: For now, check the totals by summing in two different ways
     
-    var["Capacity|Heat"] = (
-        var["Capacity|Heat|Solar thermal"] +
-        var["Capacity|Heat|Resistive heater"] +
-        var["Capacity|Heat|Biomass"] +
-        var["Capacity|Heat|Oil"] +
-        var["Capacity|Heat|Gas"] +
-        var["Capacity|Heat|Processes"] +
-        #var["Capacity|Heat|Hydrogen"] +
-        var["Capacity|Heat|Heat pump"]
-    )
-
-    assert isclose(
+    checks.isclose(
+        "Capacity|Heat",
         var["Capacity|Heat"],
         capacities_heat[
             # exclude storage converters (i.e., dischargers)
-            ~capacities_heat.index.str.contains("discharger")
+            ~in_category(n, capacities_heat.index, "discharger")
         ].sum()
     )
 
     return var
 
 
-def get_capacities_other(n, region):
+def get_capacities_other(n, region, stats=None, checks=None):
+    if stats is None:
+        stats = CachedStatistics(n)
+    if checks is None:
+        checks = Validator(strict=True)
+
     kwargs = {
         'groupby': n.statistics.groupers.get_name_bus_and_carrier,
         'nice_names': False,
     }
 
-    var = pd.Series()
-
-    capacities_h2 = n.statistics.optimal_capacity(
+    capacities_h2 = stats.optimal_capacity(
         bus_carrier="H2",
+        region=region,
         **kwargs,
-    ).filter(
-        like=region
     ).groupby("carrier").sum().multiply(MW2GW)
 
-    var["Capacity|Hydrogen|Gas|w/ CCS"] = \
-        capacities_h2.get("SMR CC")
-    
-    var["Capacity|Hydrogen|Gas|w/o CCS"] = \
-        capacities_h2.get("SMR")
-    
-    var["Capacity|Hydrogen|Gas"] = \
-        capacities_h2.filter(like="SMR").sum()
-    
-    assert var["Capacity|Hydrogen|Gas"] == \
-        var["Capacity|Hydrogen|Gas|w/ CCS"] + \
-        var["Capacity|Hydrogen|Gas|w/o CCS"] 
-    
-    var["Capacity|Hydrogen|Electricity"] = \
-        capacities_h2.get("H2 Electrolysis", 0)
+    # Technologies, see _registry.py
+    var = pd.concat([
+        get_registered(stats, region, "Capacity|Hydrogen|"),
+        get_registered(stats, region, "Capacity|Gases|"),
+        get_registered(stats, region, "Capacity|Liquids|"),
+    ])
+
+    # Parents, e.g. Capacity|Hydrogen|Gas, see _aggregation.py
+    var = aggregate(var)
 
-    var["Capacity|Hydrogen"] = (
-        var["Capacity|Hydrogen|Electricity"]
-        + var["Capacity|Hydrogen|Gas"]
+    checks.isclose(
+        "Capacity|Hydrogen|Gas",
+        var["Capacity|Hydrogen|Gas"],
+        select(n, capacities_h2, "SMR").sum(),
     )
-    assert isclose(
+    checks.isclose(
+        "Capacity|Hydrogen",
         var["Capacity|Hydrogen"],
         capacities_h2.reindex([
             "H2 Electrolysis",
@@ -415,67 +239,44 @@ def get_capacities_other(n, region):
         ]).sum(), # if technology not build, reindex returns NaN
     )
 
-    storage_capacities = n.statistics.optimal_capacity(
-        storage=True,
-        **kwargs,
-    ).filter(like=region).groupby("carrier").sum().multiply(MW2GW)
-
-    var["Capacity|Hydrogen|Reservoir"] = \
-        storage_capacities.get("H2")
 
-
-
-    capacities_gas = n.statistics.optimal_capacity(
+    capacities_gas = stats.optimal_capacity(
         bus_carrier="gas",
+        region=region,
         **kwargs,
-    ).filter(
-        like=region
     ).groupby("carrier").sum().drop(
         # Drop Import (Generator, gas), Storage (Store, gas), 
         # and Transmission capacities
-        ["gas", "gas pipeline", "gas pipeline new"]
+        ["gas", "gas pipeline", "gas pipeline new"],
+        errors="ignore",
     ).multiply(MW2GW)
 
-    var["Capacity|Gases|Hydrogen"] = \
-        capacities_gas.get("Sabatier", 0)
-    
-    var["Capacity|Gases|Biomass"] = \
-        capacities_gas.reindex([
-            "biogas to gas",
-            "biogas to gas CC",
-        ]).sum()
-
-    var["Capacity|Gases"] = (
-        var["Capacity|Gases|Hydrogen"] +
-        var["Capacity|Gases|Biomass"] 
-    )
-
-    assert isclose(
+    checks.isclose(
+        "Capacity|Gases",
         var["Capacity|Gases"],
         capacities_gas.sum(),
     )
 
 
-    capacities_liquids = n.statistics.optimal_capacity(
+    capacities_liquids = stats.optimal_capacity(
         bus_carrier=["oil", "methanol"],
+        region=region,
         **kwargs,
-    ).filter(
-        like=region
     ).groupby("carrier").sum().multiply(MW2GW)
 
-    var["Capacity|Liquids|Hydrogen"] = \
-        capacities_liquids.get("Fischer-Tropsch") + \
-        capacities_liquids.get("methanolisation", 0)
-    
-    var["Capacity|Liquids"] = var["Capacity|Liquids|Hydrogen"]
-
-    assert isclose(
+    checks.isclose(
+        "Capacity|Liquids",
         var["Capacity|Liquids"], capacities_liquids.sum(),
     )
 
     return var 
 
-def get_primary_energy(n, region):
+def get_primary_energy(n, region, stats=None, checks=None):
+    if stats is None:
+        stats = CachedStatistics(n)
+    if checks is None:
+        checks = Validator(strict=True)
+
     kwargs = {
         'groupby': n.statistics.groupers.get_name_bus_and_carrier,
         'nice_names': False,
@@ -483,17 +284,19 @@ def get_primary_energy(n, region):
 
     var = pd.Series()
 
-    EU_oil_supply = n.statistics.supply(bus_carrier="oil")
+    EU_oil_supply = stats.supply(
+        bus_carrier="oil",
+        **kwargs,
+    ).groupby(["component", "carrier"]).sum()
     oil_fossil_fraction = (
         EU_oil_supply.get("Generator").get("oil")
         / EU_oil_supply.sum()
     ) # TODO Would be desirable to resolve this regionally
     
-    oil_usage = n.statistics.withdrawal(
+    oil_usage = stats.withdrawal(
         bus_carrier="oil", 
+        region=region,
         **kwargs
-    ).filter(
-        like=region
     ).groupby(
         "carrier"
     ).sum().multiply(oil_fossil_fraction).multiply(MWh2PJ)
@@ -501,11 +304,11 @@ def get_primary_energy(n, region):
     ## Primary Energy
 
     var["Primary Energy|Oil|Heat"] = \
-        oil_usage.filter(like="oil boiler").sum()
+        select(n, oil_usage, "oil boiler").sum()
 
     
     var["Primary Energy|Oil|Electricity"] = \
-        oil_usage.get("oil")
+        oil_usage.get("oil", 0)
     # This will get the oil store as well, but it should be 0
     
     var["Primary Energy|Oil"] = (
@@ -521,46 +324,47 @@ def get_primary_energy(n, region):
             ],
         ).sum()
     )   
-    assert isclose(var["Primary Energy|Oil"], oil_usage.sum())
+    checks.isclose("Primary Energy|Oil", var["Primary Energy|Oil"], oil_usage.sum())
 
     # !! TODO since gas is now regionally resolved we 
     # compute the reginoal gas supply 
-    regional_gas_supply = n.statistics.supply(
+    regional_gas_supply = stats.supply(
         bus_carrier="gas", 
+        region=region,
         **kwargs,
-    ).filter(
-        like=region
     ).groupby(
         ["component", "carrier"]
     ).sum().drop([
         "Store",
         ("Link", "gas pipeline"),
         ("Link", "gas pipeline new"),
-    ])
+    ], errors="ignore")
 
+    # Regions without gas supply or without a gas Generator have no fossil
+    # gas
     gas_fossil_fraction = (
-        regional_gas_supply.get("Generator").get("gas")
+        regional_gas_supply.get(("Generator", "gas"), 0)
         / regional_gas_supply.sum()
+        if regional_gas_supply.sum() else 0
     )
     # Eventhough biogas gets routed through the EU gas bus,
     # it should be counted separately as Primary Energy|Biomass
-    gas_usage = n.statistics.withdrawal(
+    gas_usage = stats.withdrawal(
         bus_carrier="gas", 
+        region=region,
         **kwargs,
-    ).filter(
-        like=region
     ).groupby(
         ["component", "carrier"],
     ).sum().drop([
         "Store",
         ("Link", "gas pipeline"),
         ("Link", "gas pipeline new"),
-    ]).groupby(
+    ], errors="ignore").groupby(
         "carrier"
     ).sum().multiply(gas_fossil_fraction).multiply(MWh2PJ)
 
     var["Primary Energy|Gas|Heat"] = \
-        gas_usage.filter(like="gas boiler").sum()
+        select(n, gas_usage, "gas boiler").sum()
     
     var["Primary Energy|Gas|Electricity"] = \
         gas_usage.reindex(
@@ -575,26 +379,26 @@ def get_primary_energy(n, region):
     # Q: pypsa to iamc SPLITS the CHPS. TODO Should we do the same?
 
     var["Primary Energy|Gas|Hydrogen"] = \
-        gas_usage.filter(like="SMR").sum()
+        select(n, gas_usage, "SMR").sum()
     
     var["Primary Energy|Gas"] = (
         var["Primary Energy|Gas|Heat"]
         + var["Primary Energy|Gas|Electricity"]
         + var["Primary Energy|Gas|Hydrogen"] 
-        + gas_usage.filter(like="gas for industry").sum()
+        + select(n, gas_usage, "gas for industry").sum()
     )
 
-    assert isclose(
+    checks.isclose(
+        "Primary Energy|Gas",
         var["Primary Energy|Gas"],
         gas_usage.sum(),
     )
     # ! There are CC sub-categories that could be used
 
-    coal_usage = n.statistics.withdrawal(
+    coal_usage = stats.withdrawal(
         bus_carrier=["lignite", "coal"], 
+        region=region,
         **kwargs,
-    ).filter(
-        like=region
     ).groupby(
         "carrier"
     ).sum().multiply(MWh2PJ)
@@ -614,7 +418,7 @@ def get_primary_energy(n, region):
         + coal_usage.get("coal for industry", 0)
     )
     
-    assert isclose(var["Primary Energy|Coal"], coal_usage.sum())
+    checks.isclose("Primary Energy|Coal", var["Primary Energy|Coal"], coal_usage.sum())
 
     var["Primary Energy|Fossil"] = (
         var["Primary Energy|Coal"]
@@ -622,27 +426,26 @@ def get_primary_energy(n, region):
         + var["Primary Energy|Oil"]
     )
 
-    biomass_usage = n.statistics.withdrawal(
+    biomass_usage = stats.withdrawal(
         bus_carrier=["solid biomass", "biogas"], 
+        region=region,
         **kwargs,
-    ).filter(
-        like=region
     ).groupby(
         "carrier"
     ).sum().multiply(MWh2PJ)
 
     
     var["Primary Energy|Biomass|w/ CCS"] = \
-        biomass_usage[biomass_usage.index.str.contains("CC")].sum()
+        select(n, biomass_usage, "CC").sum()
     
     var["Primary Energy|Biomass|w/o CCS"] = \
-        biomass_usage[~biomass_usage.index.str.contains("CC")].sum()
+        biomass_usage[~in_category(n, biomass_usage.index, "CC")].sum()
     
     var["Primary Energy|Biomass|Electricity"] = \
-        biomass_usage.filter(like="CHP").sum()
+        select(n, biomass_usage, "CHP").sum()
     # !!! ADDING CHP ONLY TO ELECTRICITY INSTEAD OF SPLITTING, CORRECT?
     var["Primary Energy|Biomass|Heat"] = \
-        biomass_usage.filter(like="boiler").sum()
+        select(n, biomass_usage, "boiler").sum()
     
     # var["Primary Energy|Biomass|Gases"] = \
     # Gases are only E-Fuels in AriadneDB
@@ -652,64 +455,67 @@ def get_primary_energy(n, region):
     var["Primary Energy|Biomass"] = (
         var["Primary Energy|Biomass|Electricity"]
         + var["Primary Energy|Biomass|Heat"]
-        + biomass_usage.filter(like="solid biomass for industry").sum()
-        + biomass_usage.filter(like="biogas to gas").sum()
+        + select(n, biomass_usage, "solid biomass for industry").sum()
+        + select(n, biomass_usage, "biogas to gas").sum()
     )
     
         
-    assert isclose(
+    checks.isclose(
+        "Primary Energy|Biomass",
         var["Primary Energy|Biomass"],
         biomass_usage.sum(),
     )
 
     var["Primary Energy|Nuclear"] = \
-        n.statistics.withdrawal(
+        stats.withdrawal(
             bus_carrier=["uranium"], 
+            region=region,
             **kwargs,
-        ).filter(
-            like=region
         ).groupby(
             "carrier"
         ).sum().multiply(MWh2PJ).get("nuclear", 0)
 
 
     # ! This should basically be equivalent to secondary energy
-    renewable_electricity = n.statistics.supply(
+    renewable_electricity = stats.supply(
         bus_carrier=["AC", "low voltage"],
+        region=region,
         **kwargs,
     ).drop([
         # Assuming renewables are only generators and StorageUnits 
         "Link", "Line"
-    ]).filter(like=region).groupby("carrier").sum().multiply(MWh2PJ)
+    ], errors="ignore").groupby("carrier").sum().multiply(MWh2PJ)
 
     
-    solar_thermal_heat = n.statistics.supply(
-        bus_carrier=[
-            "urban decentral heat", 
-            "urban central heat", 
-            "rural heat",
-        ],
-        **kwargs,
-    ).filter(
-        like=region
-    ).groupby("carrier").sum().filter(
-        like="solar thermal"
+    solar_thermal_heat = select(
+        n,
+        stats.supply(
+            bus_carrier=[
+                "urban decentral heat", 
+                "urban central heat", 
+                "rural heat",
+            ],
+            region=region,
+            **kwargs,
+        ).groupby("carrier").sum(),
+        "solar thermal",
     ).multiply(MWh2PJ).sum()
 
     var["Primary Energy|Hydro"] = \
-        renewable_electricity.get([
+        renewable_electricity.reindex([
             "ror", "PHS", "hydro",
         ]).sum()
     
     var["Primary Energy|Solar"] = \
-        renewable_electricity.filter(like="solar").sum() + \
+        select(n, renewable_electricity, "solar").sum() + \
         solar_thermal_heat
 
         
     var["Primary Energy|Wind"] = \
-        renewable_electricity.filter(like="wind").sum()
+        select(n, renewable_electricity, "wind").sum()
 
-    assert isclose(
+    checks.isclose(
+        "Primary Energy|Hydro, Solar and Wind",
         renewable_electricity.sum(),
         (
             var["Primary Energy|Hydro"] 
@@ -723,241 +529,95 @@ def get_primary_energy(n, region):
     return var
 
 
-def get_secondary_energy(n, region):
+def get_secondary_energy(n, region, stats=None, checks=None):
+    if stats is None:
+        stats = CachedStatistics(n)
+    if checks is None:
+        checks = Validator(strict=True)
+
     kwargs = {
         'groupby': n.statistics.groupers.get_name_bus_and_carrier,
         'nice_names': False,
     }
-    var = pd.Series()
-
-    electricity_supply = n.statistics.supply(
-        bus_carrier=["low voltage", "AC"], **kwargs
-    ).filter(like=region).groupby(
+    electricity_supply = stats.supply(
+        bus_carrier=["low voltage", "AC"], region=region, **kwargs
+    ).groupby(
         ["carrier"]
     ).sum().multiply(MWh2PJ).drop(
-        ["AC", "DC", "electricity distribution grid" ]
+        ["AC", "DC", "electricity distribution grid" ],
+        errors="ignore",
     )
 
-    var["Secondary Energy|Electricity|Coal|Hard Coal"] = \
-        electricity_supply.get("coal", 0)
-    
-    var["Secondary Energy|Electricity|Coal|Lignite"] = \
-        electricity_supply.get("lignite", 0)
-    
-    var["Secondary Energy|Electricity|Coal"] = (
-        var["Secondary Energy|Electricity|Coal|Hard Coal"] 
-        + var["Secondary Energy|Electricity|Coal|Lignite"]
-    )
-    
-    var["Secondary Energy|Electricity|Oil"] = \
-        electricity_supply.get("oil", 0)
-    
-    var["Secondary Energy|Electricity|Gas"] = \
-        electricity_supply.reindex(
-            [
-                'CCGT',
-                'OCGT',
-                'urban central gas CHP',
-                'urban central gas CHP CC',
-            ],
-        ).sum()
-    
-    var["Secondary Energy|Electricity|Fossil"] = (
-        var["Secondary Energy|Electricity|Gas"]
-        + var["Secondary Energy|Electricity|Oil"]
-        + var["Secondary Energy|Electricity|Coal"]
-    )
+    # Technologies, losses and curtailment, see _registry.py
+    var = pd.concat([
+        get_registered(stats, region, "Secondary Energy|Electricity|"),
+        get_registered(stats, region, "Secondary Energy|Heat|"),
+        get_registered(stats, region, "Secondary Energy|Hydrogen|"),
+        get_registered(stats, region, "Secondary Energy|Other Carrier"),
+    ])
 
-    var["Secondary Energy|Electricity|Biomass|w/o CCS"] = \
-        electricity_supply.get('urban central solid biomass CHP', 0)
-    var["Secondary Energy|Electricity|Biomass|w/ CCS"] = \
-        electricity_supply.get('urban central solid biomass CHP CC', 0)
-    var["Secondary Energy|Electricity|Biomass"] = (
-        var["Secondary Energy|Electricity|Biomass|w/o CCS"] 
-        + var["Secondary Energy|Electricity|Biomass|w/ CCS"] 
-    )
-    # ! Biogas to gas should go into this category
+    # Parents, e.g. Secondary Energy|Electricity|Coal, see _aggregation.py
+    var = aggregate(var)
+
+    # ! Biogas to gas should go into Secondary Energy|Electricity|Biomass
     # How to do that? (trace e.g., biogas to gas -> CCGT)
     # If so: Should double counting with |Gas be avoided?
     # -> Might use gas_fossil_fraction just like above  
 
-
-    var["Secondary Energy|Electricity|Hydro"] = (
-        electricity_supply.get("hydro")
-        + electricity_supply.get("ror")
-    )
-    # ! Neglecting PHS here because it is storage infrastructure
-
-    var["Secondary Energy|Electricity|Nuclear"] = \
-        electricity_supply.filter(like="nuclear").sum()
-    var["Secondary Energy|Electricity|Solar"] = \
-        electricity_supply.filter(like="solar").sum()
-    var["Secondary Energy|Electricity|Wind|Offshore"] = \
-        electricity_supply.get("onwind")
-    var["Secondary Energy|Electricity|Wind|Onshore"] = \
-        electricity_supply.filter(like="offwind").sum()
-    var["Secondary Energy|Electricity|Wind"] = (
-        var["Secondary Energy|Electricity|Wind|Offshore"]
-        + var["Secondary Energy|Electricity|Wind|Onshore"]
+    # Alternative groupings, not part of Secondary Energy|Electricity
+    var["Secondary Energy|Electricity|Fossil"] = (
+        var["Secondary Energy|Electricity|Gas"]
+        + var["Secondary Energy|Electricity|Oil"]
+        + var["Secondary Energy|Electricity|Coal"]
     )
+
     var["Secondary Energy|Electricity|Non-Biomass Renewables"] = (
         var["Secondary Energy|Electricity|Hydro"]
         + var["Secondary Energy|Electricity|Solar"]
         + var["Secondary Energy|Electricity|Wind"]
     )
 
-    var["Secondary Energy|Electricity|Hydrogen"] = \
-        electricity_supply.get("H2 Fuel Cell", 0)
-    # ! Add H2 Turbines if they get implemented
-
-    var["Secondary Energy|Electricity|Curtailment"] = \
-        n.statistics.curtailment(
-            bus_carrier=["AC", "low voltage"], **kwargs
-        ).filter(like=region).multiply(MWh2PJ).values.sum()
-    
-
-    var["Secondary Energy|Electricity|Storage Losses"] = \
-        n.statistics.withdrawal(
-            bus_carrier=["AC", "low voltage"], **kwargs
-        ).filter(like=region).groupby(["carrier"]).sum().reindex(
-            [
-                "BEV charger", 
-                "battery charger", 
-                "home battery charger",
-                "PHS",
-            ]
-        ).subtract(
-            n.statistics.supply(
-                bus_carrier=["AC", "low voltage"], **kwargs
-            ).filter(like=region).groupby(["carrier"]).sum().reindex(
-                [
-                    "V2G", 
-                    "battery discharger", 
-                    "home battery discharger",
-                    "PHS",
-                ]
-            )
-        ).multiply(MWh2PJ).sum()
-
-    var["Secondary Energy|Electricity|Transmission Losses"] = \
-        n.statistics.withdrawal(
-            bus_carrier=["AC", "low voltage"], **kwargs
-        ).filter(like=region).groupby(["carrier"]).sum().get(
-            ["AC", "DC", "electricity distribution grid"]
-        ).subtract(
-            n.statistics.supply(
-                bus_carrier=["AC", "low voltage"], **kwargs
-            ).filter(like=region).groupby(["carrier"]).sum().get(
-                ["AC", "DC", "electricity distribution grid"]
-            )
-        ).multiply(MWh2PJ).sum()
-
     # supply - withdrawal
     # var["Secondary Energy|Electricity|Storage"] = \
-    var["Secondary Energy|Electricity"] = (
-        var["Secondary Energy|Electricity|Fossil"]
-        + var["Secondary Energy|Electricity|Biomass"]
-        + var["Secondary Energy|Electricity|Non-Biomass Renewables"]
-        + var["Secondary Energy|Electricity|Nuclear"]
-        #+ var["Secondary Energy|Electricity|Transmission Losses"]
-        #+ var["Secondary Energy|Electricity|Storage Losses"]
-        + var["Secondary Energy|Electricity|Hydrogen"]
-    )
 
-    assert isclose(
+    checks.isclose(
+        "Secondary Energy|Electricity",
         electricity_supply[
-            ~electricity_supply.index.str.contains(
-                "PHS"
-                "|battery discharger"
-                "|home battery discharger"
-                "|V2G"
-            )
+            ~in_category(n, electricity_supply.index, "electricity storage")
         ].sum(),
         var["Secondary Energy|Electricity"],
     )
 
-    heat_supply = n.statistics.supply(
+    heat_supply = stats.supply(
         bus_carrier=[
             "urban central heat",
-            # rural and urban decentral heat do not produce secondary energy
-            # "urban decentral heat", "rural heat"
-        ], **kwargs
-    ).filter(like=region).groupby(
+        ], region=region, **kwargs
+    ).groupby(
         ["carrier"]
     ).sum().multiply(MWh2PJ)
 
-    var["Secondary Energy|Heat|Gas"] = \
-        heat_supply.filter(like="gas").sum()
-    # !!! Again, keep the CHPs in mind! 
-    # Here the heat output is considered, but not for primary input
-    
-
-    var["Secondary Energy|Heat|Biomass"] = \
-        heat_supply.filter(like="biomass").sum()
     # var["Secondary Energy|Heat|Coal"] = \
     # var["Secondary Energy|Heat|Geothermal"] = \
     # var["Secondary Energy|Heat|Nuclear"] = \
     # var["Secondary Energy|Heat|Other"] = \
     # ! Not implemented
 
-    var["Secondary Energy|Heat|Oil"] = \
-        heat_supply.filter(like="oil boiler").sum()
-    
-    var["Secondary Energy|Heat|Solar"] = \
-        heat_supply.filter(like="solar thermal").sum()
-    
-    var["Secondary Energy|Heat|Electricity|Heat Pumps"] = \
-        heat_supply.filter(like="heat pump").sum()
-    var["Secondary Energy|Heat|Electricity|Resistive"] = \
-        heat_supply.filter(like="resistive heater").sum()
-    var["Secondary Energy|Heat|Electricity"] = (
-        var["Secondary Energy|Heat|Electricity|Heat Pumps"] 
-        + var["Secondary Energy|Heat|Electricity|Resistive"] 
-    )
-    var["Secondary Energy|Heat|Other"] = \
-        heat_supply.reindex(
-            [
-                "Fischer-Tropsch",
-                "H2 Fuel Cell", 
-                "H2 Electrolysis",
-                "Sabatier",
-                "methanolisation",
-            ]
-        ).sum()
-    # TODO remember to specify in comments
-    var["Secondary Energy|Heat"] = (
-        var["Secondary Energy|Heat|Gas"]
-        + var["Secondary Energy|Heat|Biomass"]
-        + var["Secondary Energy|Heat|Oil"]
-        + var["Secondary Energy|Heat|Solar"]
-        + var["Secondary Energy|Heat|Electricity"]
-        + var["Secondary Energy|Heat|Other"]
-    )
-    assert isclose(
+    checks.isclose(
+        "Secondary Energy|Heat",
         var["Secondary Energy|Heat"],
         heat_supply[
-            ~heat_supply.index.str.contains("discharger")
+            ~in_category(n, heat_supply.index, "discharger")
         ].sum()
     )
 
-    hydrogen_production = n.statistics.supply(
-        bus_carrier="H2", **kwargs
-    ).filter(like=region).groupby(
+    hydrogen_production = stats.supply(
+        bus_carrier="H2", region=region, **kwargs
+    ).groupby(
         ["carrier"]
     ).sum().multiply(MWh2PJ)
 
-    var["Secondary Energy|Hydrogen|Electricity"] = \
-        hydrogen_production.get('H2 Electrolysis', 0)
-
-    var["Secondary Energy|Hydrogen|Gas"] = \
-        hydrogen_production.get(["SMR","SMR CC"]).sum()
-
-    var["Secondary Energy|Hydrogen"] = (
-        var["Secondary Energy|Hydrogen|Electricity"] 
-        + var["Secondary Energy|Hydrogen|Gas"]
-    )
-
-    assert isclose(
+    checks.isclose(
+        "Secondary Energy|Hydrogen",
         var["Secondary Energy|Hydrogen"],
         hydrogen_production[
             ~hydrogen_production.index.isin(
@@ -966,17 +626,19 @@ def get_secondary_energy(n, region):
         ].sum()
     )
 
-    EU_oil_supply = n.statistics.supply(bus_carrier="oil")
+    EU_oil_supply = stats.supply(
+        bus_carrier="oil",
+        **kwargs,
+    ).groupby(["component", "carrier"]).sum()
     oil_fossil_fraction = (
         EU_oil_supply.get("Generator").get("oil")
         / EU_oil_supply.sum()
     ) # TODO Would be desirable to resolve this regionally
     
-    oil_fuel_usage = n.statistics.withdrawal(
+    oil_fuel_usage = stats.withdrawal(
         bus_carrier="oil", 
+        region=region,
         **kwargs
-    ).filter(
-        like=region
     ).groupby(
         "carrier"
     ).sum().multiply(oil_fossil_fraction).multiply(MWh2PJ).reindex(
@@ -1001,33 +663,34 @@ def get_secondary_energy(n, region):
         + var["Secondary Energy|Liquids|Hydrogen"]
     )
     
-    methanol_production = n.statistics.supply(
-        bus_carrier="methanol", **kwargs
-    ).filter(like=region).groupby(
+    methanol_production = stats.supply(
+        bus_carrier="methanol", region=region, **kwargs
+    ).groupby(
         ["carrier"]
     ).sum().multiply(MWh2PJ)
 
-    assert methanol_production.size <= 1 # only methanolisation
-
-    # var["Production|Chemicals|Methanol"] = \ # here units are Mt/year
-    var["Secondary Energy|Other Carrier"] = \
-        methanol_production.get("methanolisation", 0)
-    # Methanol should probably not be in Liquids
-    # Remeber to specify that Other Carrier == Methanol in Comments Tab
+    # Secondary Energy|Other Carrier is methanolisation, see _registry.py
+    checks.check(
+        "Secondary Energy|Other Carrier only from methanolisation",
+        methanol_production.size <= 1,
+    )
 
 
-    gas_production = n.statistics.supply(
-        bus_carrier="gas", **kwargs
-    ).filter(like=region).groupby(
+    gas_production = stats.supply(
+        bus_carrier="gas", region=region, **kwargs
+    ).groupby(
         ["carrier", "component"]
     ).sum().multiply(MWh2PJ).drop(
-        ["gas pipeline", "gas pipeline new", ("gas", "Store")]
+        ["gas pipeline", "gas pipeline new", ("gas", "Store")],
+        errors="ignore",
     ).groupby("carrier").sum() 
     total_gas_production = gas_production.sum()
+    # Shares of the regional gas production, all 0 without gas production
+    gas_production_share = gas_production.div(total_gas_production or 1)
 
-    gas_fuel_usage = n.statistics.withdrawal(
-        bus_carrier="gas", **kwargs
-    ).filter(like=region).groupby(
+    gas_fuel_usage = stats.withdrawal(
+        bus_carrier="gas", region=region, **kwargs
+    ).groupby(
         ["carrier"]
     ).sum().multiply(MWh2PJ).reindex(
         [
@@ -1043,20 +706,17 @@ def get_secondary_energy(n, region):
     # Fraction supplied by Hydrogen conversion
     var["Secondary Energy|Gases|Hydrogen"] = (
         total_gas_fuel_usage
-        * gas_production.get("Sabatier", 0)
-        / total_gas_production
+        * gas_production_share.get("Sabatier", 0)
     )
         
     var["Secondary Energy|Gases|Biomass"] = (
         total_gas_fuel_usage
-        * gas_production.filter(like="biogas to gas").sum()
-        / total_gas_production
+        * select(n, gas_production_share, "biogas to gas").sum()
     )
         
     var["Secondary Energy|Gases|Natural Gas"] = (
         total_gas_fuel_usage
-        * gas_production.get("gas")
-        / total_gas_production
+        * gas_production_share.get("gas", 0)
     )
 
     var["Secondary Energy|Gases"] = (
@@ -1065,7 +725,8 @@ def get_secondary_energy(n, region):
         + var["Secondary Energy|Gases|Natural Gas"]
     )
 
-    assert isclose(
+    checks.isclose(
+        "Secondary Energy|Gases",
         var["Secondary Energy|Gases"],
         gas_fuel_usage.sum()
     )
@@ -1073,16 +734,22 @@ def get_secondary_energy(n, region):
 
     return var
 
-def get_final_energy(n, region, _industry_demand, _energy_totals):
+def get_final_energy(
+    n, region, _industry_demand, _energy_totals, stats=None, checks=None,
+):
+    if stats is None:
+        stats = CachedStatistics(n)
+    if checks is None:
+        checks = Validator(strict=True)
 
 
     var = pd.Series()
 
     energy_totals = _energy_totals.loc[region[0:2]]
 
-    industry_demand = _industry_demand.filter(
-        like=region, axis=0,
-    ).sum()
+    industry_demand = get_regional_industry_demand(
+        n, _industry_demand
+    ).loc[region]
 
     # Q: Pypsa-eur does not strictly distinguish between energy and
     # non-energy use??
@@ -1146,42 +813,39 @@ def get_final_energy(n, region, _industry_demand, _energy_totals):
     }
 
     # Final energy is delivered to the consumers
-    low_voltage_electricity = n.statistics.withdrawal(
+    low_voltage_electricity = stats.withdrawal(
         bus_carrier="low voltage", 
+        region=region,
         **kwargs,
-    ).filter(
-        like=region,
     ).groupby("carrier").sum().multiply(MWh2PJ)
     
     var["Final Energy|Residential and Commercial|Electricity"] = \
         low_voltage_electricity[
             # carrier does not contain one of the following substrings
-            ~low_voltage_electricity.index.str.contains(
-                "urban central|industry|agriculture|charger"
-                # Excluding chargers (battery and EV)
-            )
+            ~in_category(n, low_voltage_electricity.index, "other sectors")
+            # Excluding chargers (battery and EV)
+            & ~in_category(n, low_voltage_electricity.index, "charger")
         ].sum()
 
     # urban decentral heat and rural heat are delivered as different forms of energy
     # (gas, oil, biomass, ...)
-    decentral_heat_withdrawal = n.statistics.withdrawal(
+    decentral_heat_withdrawal = stats.withdrawal(
         bus_carrier=["rural heat", "urban decentral heat"], 
+        region=region,
         **kwargs,
-    ).filter(
-        like=region,
     ).groupby("carrier").sum().multiply(MWh2PJ)
 
     decentral_heat_residential_and_commercial_fraction = (
-        decentral_heat_withdrawal.get(
+        decentral_heat_withdrawal.reindex(
             ["rural heat", "urban decentral heat"]
-        ).sum() / decentral_heat_withdrawal.sum()
+        ).fillna(0).sum() / decentral_heat_withdrawal.sum()
+        if decentral_heat_withdrawal.sum() else 0
     )
 
-    decentral_heat_supply_rescom = n.statistics.supply(
+    decentral_heat_supply_rescom = stats.supply(
         bus_carrier=["rural heat", "urban decentral heat"], 
+        region=region,
         **kwargs,
-    ).filter(
-        like=region,
     ).groupby("carrier").sum().multiply(MWh2PJ).multiply(
         decentral_heat_residential_and_commercial_fraction
     )
@@ -1189,18 +853,18 @@ def get_final_energy(n, region, _industry_demand, _energy_totals):
 
     var["Final Energy|Residential and Commercial|Heat"] = (
         sum_load(n, "urban central heat", region) # Maybe use n.statistics instead
-        + decentral_heat_supply_rescom.filter(like="solar thermal").sum()
+        + select(n, decentral_heat_supply_rescom, "solar thermal").sum()
     )
         # Assuming for solar thermal secondary energy == Final energy
 
     var["Final Energy|Residential and Commercial|Gases"] = \
-        decentral_heat_supply_rescom.filter(like="gas boiler").sum()
+        select(n, decentral_heat_supply_rescom, "gas boiler").sum()
 
     # var["Final Energy|Residential and Commercial|Hydrogen"] = \
     # ! Not implemented
 
     var["Final Energy|Residential and Commercial|Liquids"] = \
-        decentral_heat_supply_rescom.filter(like="oil boiler").sum()
+        select(n, decentral_heat_supply_rescom, "oil boiler").sum()
     
     # var["Final Energy|Residential and Commercial|Other"] = \
     # var["Final Energy|Residential and Commercial|Solids|Coal"] = \
@@ -1208,7 +872,7 @@ def get_final_energy(n, region, _industry_demand, _energy_totals):
 
     var["Final Energy|Residential and Commercial|Solids"] = \
     var["Final Energy|Residential and Commercial|Solids|Biomass"] = \
-        decentral_heat_supply_rescom.filter(like="biomass boiler").sum()
+        select(n, decentral_heat_supply_rescom, "biomass boiler").sum()
 
     # Q: Everything else seems to be not implemented
 
@@ -1248,7 +912,10 @@ def get_final_energy(n, region, _industry_demand, _energy_totals):
         + energy_totals["total international navigation"]
     )
 
-    EU_oil_supply = n.statistics.supply(bus_carrier="oil")
+    EU_oil_supply = stats.supply(
+        bus_carrier="oil",
+        **kwargs,
+    ).groupby(["component", "carrier"]).sum()
     oil_fossil_fraction = (
         EU_oil_supply.get("Generator").get("oil")
         / EU_oil_supply.sum()
@@ -1318,7 +985,8 @@ def get_final_energy(n, region, _industry_demand, _energy_totals):
         + var["Final Energy|Agriculture|Liquids"]
     )
 
-    assert isclose(
+    checks.isclose(
+        "Final Energy|Agriculture",
         var["Final Energy|Agriculture"],
         energy_totals.get("total agriculture")
     ) 
@@ -1360,22 +1028,26 @@ def get_final_energy(n, region, _industry_demand, _energy_totals):
 
 
 # convert EURXXXX to EUR2020
-def get_prices(n, region):
+def get_prices(n, region, stats=None):
+    if stats is None:
+        stats = CachedStatistics(n)
+
     var = {}
     groupby = n.statistics.groupers.get_name_bus_and_carrier
 
-    nodal_flows = n.statistics.withdrawal(
+    nodal_flows = stats.withdrawal(
         bus_carrier="low voltage", 
         groupby=groupby,
         aggregate_time=False,
-    ).filter(
-        like=region,
-        axis=0,
-    ).query( # Take care to exclude everything else at this bus
-        "not carrier.str.contains('agriculture')"
-         "& not carrier.str.contains('industry')"
-         "& not carrier.str.contains('urban central')"
-    ).groupby("bus").sum().T 
+        region=region,
+    )
+    nodal_flows = nodal_flows[ # Take care to exclude everything else at this bus
+        ~in_category(
+            n,
+            nodal_flows.index.get_level_values("carrier"),
+            "other sectors",
+        )
+    ].groupby("bus").sum().T 
 
     nodal_prices = n.buses_t.marginal_price[nodal_flows.columns] 
 
@@ -1439,10 +1111,10 @@ def get_emissions(n, region):
         sum_co2(
             n,
             [
-                *n.links.carrier.filter(like="oil boiler").unique(),
-                *n.links.carrier.filter(like="gas boiler").unique(),
+                *get_carriers(n, "oil boiler"),
+                *get_carriers(n, "gas boiler"),
                 # matches "gas CHP CC" as well
-                *n.links.carrier.filter(like="gas CHP").unique(),
+                *get_carriers(n, "gas CHP"),
             ],
             region
         )
@@ -1491,8 +1163,8 @@ def get_emissions(n, region):
     var["Emissions|CO2|Energy|Supply|Heat"] = \
         sum_co2(n,
             [
-                *n.links.carrier.filter(like="oil boiler").unique(),
-                *n.links.carrier.filter(like="gas boiler").unique(),
+                *get_carriers(n, "oil boiler"),
+                *get_carriers(n, "gas boiler"),
             ], 
             region,
         )
@@ -0,0 +1,69 @@
+"""
+Input data of the export besides the networks, i.e. the energy totals and
+the industrial energy demand of PyPSA-Eur.
+
+Every file is parsed and converted to PJ once per process, and the parsed
+table is cached next to the file for later runs. Slices per country or
+region are label lookups on tables indexed accordingly.
+"""
+from functools import lru_cache
+from weakref import WeakKeyDictionary
+
+import pandas as pd
+
+from _cache import load_parsed
+from _utils import get_bus_regions
+
+TWh2PJ = 3.6
+
+
+def _read_energy_totals(path):
+    return pd.read_csv(path, index_col=0).multiply(TWh2PJ)
+
+
+@lru_cache
+def load_energy_totals(path="resources/energy_totals.csv"):
+    # Energy totals in PJ, indexed by country
+    return load_parsed(path, _read_energy_totals, "PJ")
+
+
+def _read_industry_demand(path):
+    industry_demand = pd.read_csv(
+        path, index_col="TWh/a (MtCO2/a)",
+    ).multiply(TWh2PJ)
+    industry_demand.index.name = "bus"
+    return industry_demand
+
+
+# Scenarios which only differ in ll, opts or sector_opts share the
+# industrial demand, so it is read once per process
+@lru_cache
+def load_industry_demand(simpl, clusters, year):
+    # Industrial energy demand in PJ, indexed by bus
+    return load_parsed(
+        "resources/industrial_energy_demand_elec_s{simpl}_{clusters}_{year}.csv".format(
+            simpl=simpl,
+            clusters=clusters,
+            year=year,
+        ),
+        _read_industry_demand,
+        "PJ",
+    )
+
+
+def get_regional_industry_demand(n, industry_demand):
+    """
+    The industrial demand (indexed by bus) summed per region of the buses
+    of `n`, indexed by region, with 0 for regions without industry.
+    Computed once per network and table.
+    """
+    cached = _regional_industry_demand.setdefault(n, {})
+    if id(industry_demand) not in cached:
+        regional = industry_demand.groupby(
+            get_bus_regions(n, industry_demand.index), observed=False,
+        ).sum().rename_axis("region")
+        # Keep the table, such that its id is not reused while cached
+        cached[id(industry_demand)] = (industry_demand, regional)
+    return cached[id(industry_demand)][1]
+
+_regional_industry_demand = WeakKeyDictionary()
@@ -0,0 +1,295 @@
+import gc
+import json
+import os
+import resource
+import sys
+from collections import OrderedDict
+from hashlib import sha1
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pypsa
+import xarray as xr
+
+import _statistics
+import _utils
+
+
+# Time series which the getters read. Everything else in the `_t` tables
+# (e.g. p_set, state_of_charge, mu_*) is never materialized on export.
+# Static tables are small and always loaded completely.
+EXPORT_SERIES = {
+    "buses": ["marginal_price"],
+    "generators": ["p", "p_max_pu"],
+    "storage_units": ["p", "p_max_pu"],
+    "*": [r"p\d*"],
+}
+
+# Time series which are still needed if the annual sums come from a sidecar
+SIDECAR_SERIES = {
+    "buses": ["marginal_price"],
+}
+
+
+def _wanted(ds, variable, series):
+    # Time series are called "{list_name}_t_{attr}" and indexed by snapshots
+    if "snapshots" not in ds[variable].dims or "_t_" not in variable:
+        return True
+    return _utils.is_selected(series, *variable.split("_t_", 1))
+
+
+def _read_network(path, series):
+    if series is None:
+        n = pypsa.Network(path)
+    else:
+        with xr.open_dataset(path) as ds:
+            n = pypsa.Network()
+            n.import_from_netcdf(
+                ds[[v for v in ds.data_vars if _wanted(ds, v, series)]]
+            )
+    # Time series which are all 0 are not in the file either, so only the
+    # selection tells them apart from the ones which were skipped
+    _statistics._read_series[n] = series
+    return n
+
+
+def load_network(path, series=EXPORT_SERIES, sidecar=False, chunk_size=None):
+    """
+    Load a postnetwork for the export.
+
+    The NetCDF file is opened lazily and only the static tables and the
+    time series matching `series` (attributes per list name, "*" for all
+    components, regular expressions allowed) are read from disk. Pass
+    `series=None` to load the full network.
+
+    With `sidecar=True`, the weighted annual sums are memory-mapped from the
+    sidecar next to the file (see `write_sidecar`) and the power time series
+    are not read at all. A missing or outdated sidecar is (re)written.
+
+    With `chunk_size`, the annual sums are computed right away, one chunk of
+    `chunk_size` snapshots at a time (see `_utils.weighted_sum`). The
+    getters and helpers then read them from the caches of `_utils` and
+    `_statistics`.
+    """
+    if sidecar and _sidecar_is_valid(path):
+        n = _read_network(path, SIDECAR_SERIES)
+        if read_sidecar(n, path):
+            return n
+
+    n = _read_network(path, series)
+    if sidecar:
+        write_sidecar(n, path, chunk_size)
+    elif chunk_size:
+        get_annual_sums(n, chunk_size)
+    return n
+
+
+# %% Sidecar files with the annual sums of a network
+
+def get_sidecar_path(path):
+    # e.g. postnetworks/elec_..._2030.nc -> postnetworks/elec_..._2030.annual
+    return Path(path).with_suffix(".annual")
+
+
+def _file_key(path):
+    # Cheap stand-in for a hash of a multi-GB file
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def _index_digest(index):
+    return sha1("\n".join(index).encode()).hexdigest()
+
+
+def get_annual_sums(n, chunk_size=None):
+    # All annual sums the getters use, keyed by (kind, component, port)
+    sums = {}
+    for (c, port), values in _utils.get_weighted_sums(n, chunk_size).items():
+        sums["sum", c, port] = values
+    for (c, port), energies in _statistics.get_port_energies(
+        n, chunk_size,
+    ).items():
+        sums["supply", c, port] = energies.supply
+        sums["withdrawal", c, port] = energies.withdrawal
+    for c, values in _statistics.get_curtailed_energy(n, chunk_size).items():
+        sums["curtailment", c, ""] = values
+    return sums
+
+
+def write_sidecar(n, path, chunk_size=None):
+    """
+    Write the annual sums of the network `n`, loaded from `path`, to a
+    directory of .npy files next to it.
+
+    Every array is aligned to the static table of its component, with NaN
+    for assets without time series. meta.json holds the size and mtime of
+    the network file and is written last, such that an interrupted write
+    leaves an invalid sidecar.
+    """
+    directory = get_sidecar_path(path)
+    directory.mkdir(exist_ok=True)
+    (directory / "meta.json").unlink(missing_ok=True)
+
+    arrays = {}
+    for i, (key, values) in enumerate(get_annual_sums(n, chunk_size).items()):
+        c = key[1]
+        np.save(
+            directory / f"{i}.npy",
+            values.reindex(n.df(c).index).to_numpy(dtype=float),
+        )
+        arrays[f"{i}.npy"] = key
+
+    meta = {
+        **_file_key(path),
+        "components": {
+            c: _index_digest(n.df(c).index)
+            for c in {key[1] for key in arrays.values()}
+        },
+        "arrays": arrays,
+    }
+    with open(directory / "meta.json.tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(directory / "meta.json.tmp", directory / "meta.json")
+
+
+def _read_meta(path):
+    try:
+        with open(get_sidecar_path(path) / "meta.json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _sidecar_is_valid(path):
+    meta = _read_meta(path)
+    return meta is not None and all(
+        meta[k] == v for k, v in _file_key(path).items()
+    )
+
+
+def read_sidecar(n, path):
+    """
+    Memory-map the annual sums of the sidecar of `path` into the caches of
+    `_utils` and `_statistics` for the network `n`. Returns False if the
+    sidecar does not fit the components of `n`.
+    """
+    meta = _read_meta(path)
+    if meta is None or any(
+        _index_digest(n.df(c).index) != digest
+        for c, digest in meta["components"].items()
+    ):
+        return False
+
+    weighted_sums, port_energies, curtailed_energy = {}, {}, {}
+    for file, (kind, c, port) in meta["arrays"].items():
+        values = pd.Series(
+            np.load(get_sidecar_path(path) / file, mmap_mode="r"),
+            index=n.df(c).index,
+        ).dropna()
+        if kind == "sum":
+            weighted_sums[c, port] = values
+        elif kind == "curtailment":
+            curtailed_energy[c] = values
+        else:
+            port_energies.setdefault((c, port), {})[kind] = values
+
+    _utils._weighted_sums[n] = weighted_sums
+    _statistics._port_energies[n] = {
+        key: pd.DataFrame(energies) for key, energies in port_energies.items()
+    }
+    _statistics._curtailed_energy[n] = curtailed_energy
+    return True
+
+
+# %% Pool of loaded networks
+
+def network_size(n):
+    # Approximate memory of the static tables and time series in bytes
+    size = 0
+    for c in n.iterate_components():
+        size += c.df.memory_usage(deep=True).sum()
+        size += sum(
+            df.memory_usage(deep=True).sum() for df in c.pnl.values()
+        )
+    return int(size)
+
+
+class NetworkPool:
+    """
+    Loaded networks, at most `max_memory` bytes of them (approximately, see
+    `network_size`).
+
+    `get` loads a network on demand (see `load_network`) and returns the
+    loaded one if the file and the load options did not change. Before a network is loaded, the
+    least recently used networks are evicted until it fits next to the
+    others, with its file size as estimate. With `max_memory=0`, only one
+    network is kept, and it is freed before the next one is loaded.
+    """
+
+    def __init__(self, max_memory=0):
+        self.max_memory = max_memory
+        self.networks = OrderedDict()
+        self.sizes = {}
+        self.loads = 0
+        self.hits = 0
+
+    def get(self, path, **kwargs):
+        # e.g. a network loaded from a sidecar lacks the power time series,
+        # so it does not serve a request without sidecar
+        key = (
+            str(path),
+            *_file_key(path).values(),
+            json.dumps(kwargs, sort_keys=True),
+        )
+        if key in self.networks:
+            self.networks.move_to_end(key)
+            self.hits += 1
+            return self.networks[key]
+
+        self.evict(os.stat(path).st_size)
+        n = load_network(path, **kwargs)
+        self.networks[key] = n
+        self.sizes[key] = network_size(n)
+        self.loads += 1
+        return n
+
+    def evict(self, needed=0):
+        evicted = False
+        while (
+            self.networks
+            and sum(self.sizes.values()) + needed > self.max_memory
+        ):
+            key, _ = self.networks.popitem(last=False)
+            del self.sizes[key]
+            evicted = True
+        if evicted:
+            # Networks reference themselves (e.g. via n.statistics), so they
+            # are only freed by the garbage collector
+            gc.collect()
+
+    def summary(self):
+        return "Network pool: {} networks, {:.0f} MB, {} loads, {} hits".format(
+            len(self.networks),
+            sum(self.sizes.values()) / 2**20,
+            self.loads,
+            self.hits,
+        )
+
+
+def reset_peak_memory():
+    # Resets the peak resident memory of the process on Linux, such that
+    # get_peak_memory reports the peak since then. Elsewhere, the peak
+    # stays the peak since the start of the process.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_memory():
+    # Peak resident memory of the process in bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
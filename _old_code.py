@@ -8,6 +8,7 @@ t2Mt = 1e-6
 
 
 def get_ariadne_capacities(n, region):
+    add_regions(n)
     var = {}
     ## Capacity | Electricity
 
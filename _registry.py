@@ -0,0 +1,376 @@
+"""
+Registry of IAMC variables which are plain sums of one statistic over a set
+of carriers, and the engine that evaluates all of them at once.
+
+Every row of REGISTRY reads
+
+    (variable, statistic, bus carrier(s), carriers, factor)
+
+and contributes `factor` times the sum of the statistic over the carriers.
+Variables with several rows are the sum of their rows, e.g. losses are a
+withdrawal minus a supply. Carriers are exact carrier names or `like(...)`,
+which matches every carrier of a category in _carriers.CATEGORIES, like
+`Series.filter(like=...)`. Carriers which do not exist in a region count as
+0.
+
+Variables which need more than a sum (e.g. fossil fractions) stay
+hand-written in _getters.py.
+"""
+from weakref import WeakKeyDictionary
+
+import numpy as np
+import pandas as pd
+
+from _carriers import in_category
+from _statistics import get_energy_t, get_region_level
+from _utils import MW2GW, MWh2PJ, add_regions
+
+
+class like(str):
+    # Matches all carriers of the category, see _carriers.py
+    pass
+
+
+# Keyword arguments of the CachedStatistics methods behind each statistic
+STATISTICS = {
+    "capacity": ("optimal_capacity", {}),
+    "storage capacity": ("optimal_capacity", {"storage": True}),
+    "supply": ("supply", {}),
+    "withdrawal": ("withdrawal", {}),
+    "curtailment": ("curtailment", {}),
+}
+
+# Statistics with a time dimension
+ENERGY = ["supply", "withdrawal", "curtailment"]
+
+ELECTRICITY = ("AC", "low voltage")
+HEAT = ("urban central heat", "urban decentral heat", "rural heat")
+LIQUIDS = ("oil", "methanol")
+
+REGISTRY = [
+    ## Capacity|Electricity
+    ("Capacity|Electricity|Biomass|w/ CCS", "capacity", ELECTRICITY,
+     ["urban central solid biomass CHP CC"], MW2GW),
+    ("Capacity|Electricity|Biomass|w/o CCS", "capacity", ELECTRICITY,
+     ["urban central solid biomass CHP"], MW2GW),
+    ("Capacity|Electricity|Coal|Hard Coal", "capacity", ELECTRICITY,
+     ["coal"], MW2GW),
+    ("Capacity|Electricity|Coal|Lignite", "capacity", ELECTRICITY,
+     ["lignite"], MW2GW),
+    ("Capacity|Electricity|Gas|CC", "capacity", ELECTRICITY,
+     ["CCGT"], MW2GW),
+    ("Capacity|Electricity|Gas|OC", "capacity", ELECTRICITY,
+     ["OCGT"], MW2GW),
+    ("Capacity|Electricity|Gas|w/ CCS", "capacity", ELECTRICITY,
+     ["urban central gas CHP CC"], MW2GW),
+    ("Capacity|Electricity|Gas|w/o CCS", "capacity", ELECTRICITY,
+     ["urban central gas CHP", "CCGT", "OCGT"], MW2GW),
+    ("Capacity|Electricity|Hydro", "capacity", ELECTRICITY,
+     ["ror", "hydro"], MW2GW),
+    # Q!: Not counting PHS here, because it is a true storage,
+    # as opposed to hydro
+    ("Capacity|Electricity|Hydrogen|FC", "capacity", ELECTRICITY,
+     ["H2 Fuel Cell"], MW2GW),
+    ("Capacity|Electricity|Nuclear", "capacity", ELECTRICITY,
+     ["nuclear"], MW2GW),
+    ("Capacity|Electricity|Oil", "capacity", ELECTRICITY,
+     ["oil"], MW2GW),
+    ("Capacity|Electricity|Solar|PV|Rooftop", "capacity", ELECTRICITY,
+     ["solar rooftop"], MW2GW),
+    ("Capacity|Electricity|Solar|PV|Open Field", "capacity", ELECTRICITY,
+     ["solar"], MW2GW),
+    # !: take care of "offwind" -> "offwind-ac"/"offwind-dc"
+    ("Capacity|Electricity|Wind|Offshore", "capacity", ELECTRICITY,
+     ["offwind", "offwind-ac", "offwind-dc"], MW2GW),
+    ("Capacity|Electricity|Wind|Onshore", "capacity", ELECTRICITY,
+     ["onwind"], MW2GW),
+    ("Capacity|Electricity|Storage Converter|Hydro Dam Reservoir",
+     "capacity", ELECTRICITY, ["hydro"], MW2GW),
+    ("Capacity|Electricity|Storage Converter|Pump Hydro",
+     "capacity", ELECTRICITY, ["PHS"], MW2GW),
+    ("Capacity|Electricity|Storage Converter|Stationary Batteries",
+     "capacity", ELECTRICITY,
+     ["battery discharger", "home battery discharger"], MW2GW),
+    ("Capacity|Electricity|Storage Converter|Vehicles",
+     "capacity", ELECTRICITY, ["V2G"], MW2GW),
+    ("Capacity|Electricity|Storage Reservoir|Hydro Dam Reservoir",
+     "storage capacity", None, ["hydro"], MW2GW),
+    ("Capacity|Electricity|Storage Reservoir|Pump Hydro",
+     "storage capacity", None, ["PHS"], MW2GW),
+    ("Capacity|Electricity|Storage Reservoir|Stationary Batteries",
+     "storage capacity", None, ["battery", "home battery"], MW2GW),
+    ("Capacity|Electricity|Storage Reservoir|Vehicles",
+     "storage capacity", None, ["Li ion"], MW2GW),
+
+    ## Capacity|Heat
+    ("Capacity|Heat|Solar thermal", "capacity", HEAT,
+     [like("solar thermal")], MW2GW),
+    ("Capacity|Heat|Biomass|w/ CCS", "capacity", HEAT,
+     ["urban central solid biomass CHP CC"], MW2GW),
+    ("Capacity|Heat|Biomass|w/o CCS", "capacity", HEAT,
+     ["urban central solid biomass CHP", like("biomass boiler")], MW2GW),
+    ("Capacity|Heat|Resistive heater", "capacity", HEAT,
+     [like("resistive heater")], MW2GW),
+    ("Capacity|Heat|Processes", "capacity", HEAT,
+     [
+         "Fischer-Tropsch",
+         "H2 Electrolysis",
+         "H2 Fuel Cell",
+         "Sabatier",
+         "methanolisation",
+     ], MW2GW),
+    ("Capacity|Heat|Gas", "capacity", HEAT,
+     [like("gas boiler"), like("gas CHP")], MW2GW),
+    ("Capacity|Heat|Heat pump", "capacity", HEAT,
+     [like("heat pump")], MW2GW),
+    ("Capacity|Heat|Oil", "capacity", HEAT,
+     [like("oil boiler")], MW2GW),
+    ("Capacity|Heat|Storage Converter", "capacity", HEAT,
+     [like("water tanks discharger")], MW2GW),
+    ("Capacity|Heat|Storage Reservoir", "storage capacity", None,
+     [like("water tanks")], MW2GW),
+
+    ## Capacity|Hydrogen, Gases, Liquids
+    ("Capacity|Hydrogen|Gas|w/ CCS", "capacity", "H2",
+     ["SMR CC"], MW2GW),
+    ("Capacity|Hydrogen|Gas|w/o CCS", "capacity", "H2",
+     ["SMR"], MW2GW),
+    ("Capacity|Hydrogen|Electricity", "capacity", "H2",
+     ["H2 Electrolysis"], MW2GW),
+    ("Capacity|Hydrogen|Reservoir", "storage capacity", None,
+     ["H2"], MW2GW),
+    ("Capacity|Gases|Hydrogen", "capacity", "gas",
+     ["Sabatier"], MW2GW),
+    ("Capacity|Gases|Biomass", "capacity", "gas",
+     ["biogas to gas", "biogas to gas CC"], MW2GW),
+    ("Capacity|Liquids|Hydrogen", "capacity", LIQUIDS,
+     ["Fischer-Tropsch", "methanolisation"], MW2GW),
+
+    ## Secondary Energy|Electricity
+    ("Secondary Energy|Electricity|Coal|Hard Coal", "supply", ELECTRICITY,
+     ["coal"], MWh2PJ),
+    ("Secondary Energy|Electricity|Coal|Lignite", "supply", ELECTRICITY,
+     ["lignite"], MWh2PJ),
+    ("Secondary Energy|Electricity|Oil", "supply", ELECTRICITY,
+     ["oil"], MWh2PJ),
+    ("Secondary Energy|Electricity|Gas", "supply", ELECTRICITY,
+     [
+         "CCGT",
+         "OCGT",
+         "urban central gas CHP",
+         "urban central gas CHP CC",
+     ], MWh2PJ),
+    ("Secondary Energy|Electricity|Biomass|w/o CCS", "supply", ELECTRICITY,
+     ["urban central solid biomass CHP"], MWh2PJ),
+    ("Secondary Energy|Electricity|Biomass|w/ CCS", "supply", ELECTRICITY,
+     ["urban central solid biomass CHP CC"], MWh2PJ),
+    # ! Neglecting PHS here because it is storage infrastructure
+    ("Secondary Energy|Electricity|Hydro", "supply", ELECTRICITY,
+     ["hydro", "ror"], MWh2PJ),
+    ("Secondary Energy|Electricity|Nuclear", "supply", ELECTRICITY,
+     [like("nuclear")], MWh2PJ),
+    ("Secondary Energy|Electricity|Solar", "supply", ELECTRICITY,
+     [like("solar")], MWh2PJ),
+    ("Secondary Energy|Electricity|Wind|Offshore", "supply", ELECTRICITY,
+     [like("offwind")], MWh2PJ),
+    ("Secondary Energy|Electricity|Wind|Onshore", "supply", ELECTRICITY,
+     ["onwind"], MWh2PJ),
+    # ! Add H2 Turbines if they get implemented
+    ("Secondary Energy|Electricity|Hydrogen", "supply", ELECTRICITY,
+     ["H2 Fuel Cell"], MWh2PJ),
+    ("Secondary Energy|Electricity|Curtailment", "curtailment", ELECTRICITY,
+     None, MWh2PJ),
+    ("Secondary Energy|Electricity|Storage Losses", "withdrawal", ELECTRICITY,
+     [
+         "BEV charger",
+         "battery charger",
+         "home battery charger",
+         "PHS",
+     ], MWh2PJ),
+    ("Secondary Energy|Electricity|Storage Losses", "supply", ELECTRICITY,
+     [
+         "V2G",
+         "battery discharger",
+         "home battery discharger",
+         "PHS",
+     ], -MWh2PJ),
+    ("Secondary Energy|Electricity|Transmission Losses", "withdrawal",
+     ELECTRICITY, ["AC", "DC", "electricity distribution grid"], MWh2PJ),
+    ("Secondary Energy|Electricity|Transmission Losses", "supply",
+     ELECTRICITY, ["AC", "DC", "electricity distribution grid"], -MWh2PJ),
+
+    ## Secondary Energy|Heat
+    # rural and urban decentral heat do not produce secondary energy
+    # !!! Again, keep the CHPs in mind!
+    # Here the heat output is considered, but not for primary input
+    ("Secondary Energy|Heat|Gas", "supply", "urban central heat",
+     [like("gas")], MWh2PJ),
+    ("Secondary Energy|Heat|Biomass", "supply", "urban central heat",
+     [like("biomass")], MWh2PJ),
+    ("Secondary Energy|Heat|Oil", "supply", "urban central heat",
+     [like("oil boiler")], MWh2PJ),
+    ("Secondary Energy|Heat|Solar", "supply", "urban central heat",
+     [like("solar thermal")], MWh2PJ),
+    ("Secondary Energy|Heat|Electricity|Heat Pumps", "supply",
+     "urban central heat", [like("heat pump")], MWh2PJ),
+    ("Secondary Energy|Heat|Electricity|Resistive", "supply",
+     "urban central heat", [like("resistive heater")], MWh2PJ),
+    # TODO remember to specify in comments
+    ("Secondary Energy|Heat|Other", "supply", "urban central heat",
+     [
+         "Fischer-Tropsch",
+         "H2 Fuel Cell",
+         "H2 Electrolysis",
+         "Sabatier",
+         "methanolisation",
+     ], MWh2PJ),
+
+    ## Secondary Energy|Hydrogen, Other Carrier
+    ("Secondary Energy|Hydrogen|Electricity", "supply", "H2",
+     ["H2 Electrolysis"], MWh2PJ),
+    ("Secondary Energy|Hydrogen|Gas", "supply", "H2",
+     ["SMR", "SMR CC"], MWh2PJ),
+    # Methanol should probably not be in Liquids
+    # Remember to specify that Other Carrier == Methanol in Comments Tab
+    ("Secondary Energy|Other Carrier", "supply", "methanol",
+     ["methanolisation"], MWh2PJ),
+]
+
+
+def _membership(n, carriers, selections):
+    # Boolean matrix rows x carriers, True where a row selects the carrier
+    matrix = np.zeros((len(selections), len(carriers)), dtype=bool)
+    for i, selection in enumerate(selections):
+        if selection is None:
+            matrix[i] = True
+            continue
+        for carrier in selection:
+            if isinstance(carrier, like):
+                matrix[i] |= in_category(n, carriers, carrier)
+            else:
+                matrix[i] |= carriers == carrier
+    return matrix
+
+
+def _bus_carrier(bus_carrier):
+    if isinstance(bus_carrier, tuple):
+        return list(bus_carrier)
+    if not isinstance(bus_carrier, str):
+        # groupby turns None into NaN
+        return None
+    return bus_carrier
+
+
+def evaluate_registry(stats, registry=REGISTRY):
+    """
+    All registered variables of the network of `stats` in all regions, as a
+    DataFrame Variable x Region.
+
+    Rows are grouped by (statistic, bus carrier). Each group is one cached
+    statistics call for the whole network, summed per region and carrier,
+    and multiplied with the membership matrix of its rows. The result is
+    computed once per CachedStatistics instance.
+    """
+    if stats in _evaluated:
+        return _evaluated[stats]
+
+    table = pd.DataFrame(
+        registry,
+        columns=["variable", "statistic", "bus_carrier", "carriers", "factor"],
+    )
+    variables = table.variable.unique()
+    regions = stats.regions
+    kwargs = {
+        "groupby": stats.n.statistics.groupers.get_name_bus_and_carrier,
+        "nice_names": False,
+    }
+
+    result = pd.DataFrame(0.0, index=variables, columns=regions)
+    for (statistic, bus_carrier), rows in table.groupby(
+        ["statistic", "bus_carrier"], sort=False, dropna=False,
+    ):
+        metric, extra = STATISTICS[statistic]
+        bus_carrier = _bus_carrier(bus_carrier)
+        values = getattr(stats, metric)(
+            bus_carrier=bus_carrier, **extra, **kwargs,
+        )
+        # Carrier x Region
+        values = values.groupby([
+            values.index.get_level_values("carrier"),
+            get_region_level(values.index, stats.component_regions),
+        ]).sum().unstack(fill_value=0).reindex(columns=regions, fill_value=0)
+
+        weights = _membership(
+            stats.n, values.index.astype(str), rows.carriers.tolist(),
+        ) * rows.factor.values[:, None]
+        contributions = pd.DataFrame(
+            weights @ values.values, index=rows.variable, columns=regions,
+        )
+        result = result.add(
+            contributions.groupby(level=0).sum(), fill_value=0,
+        )
+
+    result = result.reindex(variables)
+    result.columns.name = "Region"
+    _evaluated[stats] = result
+    return result
+
+_evaluated = WeakKeyDictionary()
+
+
+def evaluate_registry_t(n, snapshots=None, registry=REGISTRY):
+    """
+    The registered energy variables (all but capacities) of the network `n`
+    per snapshot, as a DataFrame Variable x (Region, snapshot). Only the
+    time series of `snapshots` (default: all) are read.
+
+    Works like `evaluate_registry`, with the weighted energy per snapshot
+    (see _statistics.get_energy_t) instead of the annual sums, so the sum
+    over all snapshots is the annual value.
+    """
+    if snapshots is None:
+        snapshots = n.snapshots
+    table = pd.DataFrame(
+        registry,
+        columns=["variable", "statistic", "bus_carrier", "carriers", "factor"],
+    )
+    table = table[table.statistic.isin(ENERGY)]
+    variables = table.variable.unique()
+    add_regions(n)
+    columns = pd.MultiIndex.from_product(
+        [[r for r in n.buses.region.cat.categories if r], snapshots],
+        names=["Region", "snapshot"],
+    )
+
+    result = pd.DataFrame(0.0, index=variables, columns=columns)
+    for (statistic, bus_carrier), rows in table.groupby(
+        ["statistic", "bus_carrier"], sort=False, dropna=False,
+    ):
+        # Carrier x (Region, snapshot)
+        values = get_energy_t(
+            n, statistic, _bus_carrier(bus_carrier), snapshots,
+        ).T.unstack("region", fill_value=0).swaplevel(axis=1).reindex(
+            columns=columns, fill_value=0,
+        )
+
+        weights = _membership(
+            n, values.index.astype(str), rows.carriers.tolist(),
+        ) * rows.factor.values[:, None]
+        contributions = pd.DataFrame(
+            weights @ values.values, index=rows.variable, columns=columns,
+        )
+        result = result.add(
+            contributions.groupby(level=0).sum(), fill_value=0,
+        )
+
+    return result.reindex(variables)
+
+
+def get_registered(stats, region, prefix=""):
+    # Registered variables starting with `prefix` in one region
+    result = evaluate_registry(stats)
+    if region in result:
+        result = result[region]
+    else:
+        result = pd.Series(0.0, index=result.index)
+    return result[result.index.str.startswith(prefix)].copy()
@@ -0,0 +1,477 @@
+from weakref import WeakKeyDictionary
+
+import pandas as pd
+from pypsa.statistics import get_name_bus_and_carrier, get_weightings
+
+from _utils import (
+    add_regions, get_annual_energy, get_component_regions, is_selected,
+    weighted_sum,
+)
+
+
+def _freeze(value):
+    # Turn the arguments of a statistics call into something hashable.
+    # The order of bus carriers does not change the result, so lists are
+    # sorted to increase the number of cache hits. Callables like groupby
+    # functions are hashable and kept as they are, such that two lambdas
+    # never share a result.
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(value))
+    return value
+
+
+def get_region_level(index, component_regions):
+    """
+    Region of every row of a statistics result indexed by (component, name,
+    bus, carrier), looked up in the output of ``get_component_regions``.
+    """
+    keys = pd.MultiIndex.from_arrays([
+        index.get_level_values("component"),
+        index.get_level_values("name"),
+    ])
+    return component_regions.reindex(keys).astype(object).fillna("").values
+
+
+def _table(c, names, buses, primary_buses, carriers, bus_carriers, port, sign,
+           values):
+    return pd.DataFrame({
+        "component": c,
+        "name": names,
+        "bus": buses,
+        "primary_bus": primary_buses,
+        "carrier": carriers,
+        "bus_carrier": bus_carriers,
+        "port": port,
+        "sign": sign,
+        "value": values,
+    })
+
+
+def _categorize(df):
+    for col in ["component", "bus", "primary_bus", "carrier", "bus_carrier"]:
+        df[col] = df[col].astype("category")
+    return df
+
+
+def get_port_energies(n, chunk_size=None):
+    """
+    Weighted annual supply and withdrawal at every port of every component,
+    as a dict {(component, port): DataFrame} with columns ``supply`` and
+    ``withdrawal``, indexed by the components connected at that port.
+
+    Every ``p*`` time series is split into its positive and negative part,
+    using the same sign conventions and snapshot weightings as
+    ``n.statistics``, one chunk of ``chunk_size`` snapshots at a time (see
+    ``_utils.weighted_sum``). Computed once per network.
+    """
+    if n in _port_energies:
+        return _port_energies[n]
+
+    energies = {}
+    for c in sorted(n.branch_components | n.one_port_components):
+        df = n.df(c)
+        if df.empty:
+            continue
+        sign = -1.0 if c in n.branch_components else df.get("sign", 1.0)
+        weights = get_weightings(n, c)
+        for port in [col[3:] for col in df if col.startswith("bus")]:
+            if f"p{port}" not in n.pnl(c):
+                continue
+            # Unused ports are "", or NaN in networks built with n.add
+            buses = df[f"bus{port}"][lambda ds: ds.fillna("") != ""]
+            port_sign = (
+                sign[buses.index] if isinstance(sign, pd.Series) else sign
+            )
+
+            # Supply and withdrawal of one chunk of snapshots, such that
+            # every chunk is read and signed once
+            def split(p, buses=buses, port_sign=port_sign):
+                signed = p.reindex(
+                    columns=buses.index, fill_value=0,
+                ).multiply(port_sign)
+                return [signed.clip(lower=0), -signed.clip(upper=0)]
+
+            supply, withdrawal = weighted_sum(
+                weights, n.pnl(c)[f"p{port}"], split, chunk_size,
+            )
+            energies[c, port] = pd.DataFrame({
+                "supply": supply, "withdrawal": withdrawal,
+            })
+
+    _port_energies[n] = energies
+    return energies
+
+_port_energies = WeakKeyDictionary()
+
+
+def get_energy_balance(n):
+    """
+    Long-format table of the weighted annual supply (``sign=1``) and
+    withdrawal (``sign=-1``) at every port of every component, built from
+    ``get_port_energies``.
+
+    The ``bus`` column holds the bus of the port, ``primary_bus`` the bus
+    that ``get_name_bus_and_carrier`` reports (``bus``, resp. ``bus0``).
+    """
+    tables = []
+    for (c, port), energies in get_port_energies(n).items():
+        df = n.df(c)
+        buses = df[f"bus{port}"]
+        carrier = df.get("carrier", pd.Series("", index=df.index))
+        primary_bus = df["bus"] if "bus" in df else df["bus0"]
+        for s, values in [
+            (1, energies.supply),
+            (-1, energies.withdrawal),
+        ]:
+            values = values[values != 0]
+            idx = values.index
+            tables.append(_table(
+                c,
+                idx,
+                buses[idx].values,
+                primary_bus[idx].values,
+                carrier[idx].values,
+                buses[idx].map(n.buses.carrier).values,
+                port,
+                s,
+                values.values,
+            ))
+
+    if not tables:
+        return _categorize(_table(*[[]] * 9))
+    return _categorize(pd.concat(tables, ignore_index=True))
+
+
+def get_curtailed_energy(n, chunk_size=None):
+    """
+    Weighted annual curtailment of every asset with a ``p_max_pu`` time
+    series, like in ``n.statistics.curtailment``, as a dict
+    {component: Series}. Computed once per network, one chunk of
+    ``chunk_size`` snapshots at a time.
+    """
+    if n in _curtailed_energy:
+        return _curtailed_energy[n]
+
+    curtailed = {}
+    for c in ["Generator", "StorageUnit"]:
+        df = n.df(c)
+        p_max_pu = n.pnl(c).get("p_max_pu", pd.DataFrame())
+        p = n.pnl(c).p
+        idx = p_max_pu.columns
+        if idx.empty:
+            continue
+        # Assets without a column in p never ran
+        curtailed[c] = weighted_sum(
+            get_weightings(n, c),
+            p_max_pu,
+            lambda p_max_pu, p=p, idx=idx, p_nom=df.p_nom_opt[idx]: (
+                p_max_pu[idx] * p_nom
+                - p.reindex(index=p_max_pu.index, columns=idx, fill_value=0)
+            ).clip(lower=0),
+            chunk_size,
+        )
+
+    _curtailed_energy[n] = curtailed
+    return curtailed
+
+_curtailed_energy = WeakKeyDictionary()
+
+
+def _at_bus_carrier(n, buses, bus_carrier):
+    # The entries of `buses` whose bus has one of the bus carriers
+    if bus_carrier is None:
+        return buses
+    if isinstance(bus_carrier, str):
+        bus_carrier = [bus_carrier]
+    return buses[buses.map(n.buses.carrier).isin(bus_carrier)]
+
+
+def _loaded(n, c, attr):
+    # A time series of `c` which the loader read (see _network.py). Columns
+    # which are not in the table are all 0.
+    if not is_selected(
+        _read_series.get(n), n.components[c]["list_name"], attr,
+    ):
+        raise ValueError(
+            f"Time series {attr!r} of {c} is not loaded, load the network "
+            "with the export series and without sidecar"
+        )
+    return n.pnl(c)[attr]
+
+# Time series selection each network was loaded with, see _network.py
+_read_series = WeakKeyDictionary()
+
+
+def get_energy_t(n, metric, bus_carrier=None, snapshots=None):
+    """
+    Weighted supply, withdrawal or curtailment per snapshot, as a DataFrame
+    snapshot x (carrier, region).
+
+    Uses the same sign conventions and weightings as ``get_port_energies``
+    and ``get_curtailed_energy``, but keeps the snapshots. Only the rows
+    ``snapshots`` (default: all) of the time series are read, such that the
+    snapshots can be processed in chunks.
+    """
+    if snapshots is None:
+        snapshots = n.snapshots
+    component_regions = get_component_regions(n)
+
+    parts = []
+    for c in sorted(n.branch_components | n.one_port_components):
+        df = n.df(c)
+        if df.empty:
+            continue
+        powers = []
+        if metric == "curtailment":
+            if c not in ["Generator", "StorageUnit"]:
+                continue
+            p_max_pu = _loaded(n, c, "p_max_pu")
+            p = _loaded(n, c, "p")
+            idx = _at_bus_carrier(
+                n, df.bus[p_max_pu.columns], bus_carrier,
+            ).index
+            if not idx.empty:
+                powers.append((
+                    p_max_pu.loc[snapshots, idx] * df.p_nom_opt[idx]
+                    - p.reindex(index=snapshots, columns=idx, fill_value=0)
+                ).clip(lower=0))
+        else:
+            sign = -1.0 if c in n.branch_components else df.get("sign", 1.0)
+            for port in [col[3:] for col in df if col.startswith("bus")]:
+                if f"p{port}" not in n.pnl(c):
+                    continue
+                buses = _at_bus_carrier(
+                    n,
+                    df[f"bus{port}"][lambda ds: ds.fillna("") != ""],
+                    bus_carrier,
+                )
+                if buses.empty:
+                    continue
+                p = _loaded(n, c, f"p{port}").reindex(
+                    index=snapshots, columns=buses.index, fill_value=0,
+                )
+                if isinstance(sign, pd.Series):
+                    p = p.multiply(sign[buses.index])
+                else:
+                    p = sign * p
+                powers.append(
+                    p.clip(lower=0) if metric == "supply"
+                    else -p.clip(upper=0)
+                )
+
+        weights = get_weightings(n, c).loc[snapshots]
+        carrier = df.get("carrier", pd.Series("", index=df.index))
+        for p in powers:
+            regions = component_regions.reindex(
+                pd.MultiIndex.from_product([[c], p.columns])
+            ).astype(object).fillna("")
+            parts.append(p.multiply(weights, axis=0).T.groupby([
+                carrier[p.columns].values, regions.values,
+            ]).sum())
+
+    if not parts:
+        return pd.DataFrame(
+            index=snapshots,
+            columns=pd.MultiIndex.from_arrays([[], []]),
+            dtype=float,
+        ).rename_axis(columns=["carrier", "region"])
+    return pd.concat(parts).groupby(level=[0, 1]).sum().T.rename_axis(
+        columns=["carrier", "region"],
+    )
+
+
+def get_curtailment(n):
+    # Curtailment in the layout of get_energy_balance
+    tables = []
+    for c, values in get_curtailed_energy(n).items():
+        df = n.df(c)
+        idx = values.index
+        tables.append(_table(
+            c,
+            idx,
+            df.bus[idx].values,
+            df.bus[idx].values,
+            df.carrier[idx].values,
+            df.bus[idx].map(n.buses.carrier).values,
+            "",
+            1,
+            values.values,
+        ))
+
+    if not tables:
+        return _categorize(_table(*[[]] * 9))
+    return _categorize(pd.concat(tables, ignore_index=True))
+
+
+class CachedStatistics:
+    """
+    Memoizing wrapper around ``n.statistics``.
+
+    Results are keyed by (network, metric, bus_carrier, groupby,
+    aggregate_time) and the remaining keyword arguments. Build one instance
+    per network and pass it to all getters, so that e.g. the oil supply is
+    computed once instead of once per getter. ``hits`` and ``misses`` count
+    how often a result was reused.
+
+    All methods accept a ``region`` argument. The statistic is then computed
+    for the whole network once and split into regions in a single groupby,
+    so evaluating many regions costs about as much as evaluating one.
+
+    Supply, withdrawal and curtailment grouped by
+    ``get_name_bus_and_carrier`` are answered from a single energy balance
+    table per network (see ``get_energy_balance``), everything else is
+    passed on to ``n.statistics``.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._regional = {}
+        self._balance = None
+        self._curtailment = None
+        self._component_regions = None
+
+    @property
+    def regions(self):
+        # All regions of the network, e.g. to evaluate "all" regions
+        add_regions(self.n)
+        return [r for r in self.n.buses.region.cat.categories if r]
+
+    @property
+    def component_regions(self):
+        if self._component_regions is None:
+            self._component_regions = get_component_regions(self.n)
+        return self._component_regions
+
+    @property
+    def balance(self):
+        if self._balance is None:
+            self._balance = get_energy_balance(self.n)
+        return self._balance
+
+    @property
+    def annual_energy(self):
+        # Weighted annual energy per (component, port, carrier, region), as
+        # used by the sum_* helpers in _utils
+        return get_annual_energy(self.n)
+
+    @property
+    def curtailment_table(self):
+        if self._curtailment is None:
+            self._curtailment = get_curtailment(self.n)
+        return self._curtailment
+
+    def _query(self, table, bus_carrier=None, sign=None):
+        mask = pd.Series(True, index=table.index)
+        if sign is not None:
+            mask &= table.sign == sign
+        if isinstance(bus_carrier, str):
+            mask &= table.bus_carrier == bus_carrier
+        elif bus_carrier is not None:
+            mask &= table.bus_carrier.isin(bus_carrier)
+
+        result = table[mask].groupby(
+            ["component", "name", "primary_bus", "carrier"],
+            observed=True,
+        ).value.sum()
+        # Plain levels, such that later groupbys only see observed values
+        index = result.index.remove_unused_levels()
+        result.index = index.set_levels(
+            [level.astype(object) for level in index.levels]
+        ).rename(["component", "name", "bus", "carrier"])
+        return result
+
+    def _from_balance(self, metric, bus_carrier, kwargs):
+        if (
+            metric not in ["supply", "withdrawal", "curtailment"]
+            or kwargs.get("aggregate_time") != "sum"
+            or kwargs.get("groupby") is not get_name_bus_and_carrier
+            or kwargs.get("nice_names", True)
+            or set(kwargs) - {"aggregate_time", "groupby", "nice_names"}
+        ):
+            return None
+
+        if metric == "curtailment":
+            return self._query(self.curtailment_table, bus_carrier)
+        sign = 1 if metric == "supply" else -1
+        return self._query(self.balance, bus_carrier, sign)
+
+    def _split_regions(self, key, result):
+        if key not in self._regional:
+            if result.empty:
+                self._regional[key] = {}
+            else:
+                self._regional[key] = dict(list(result.groupby(
+                    get_region_level(result.index, self.component_regions),
+                )))
+        return self._regional[key]
+
+    def _get(self, metric, bus_carrier=None, region=None, **kwargs):
+        key = (
+            id(self.n),
+            metric,
+            _freeze(bus_carrier),
+            _freeze(kwargs.get("groupby")),
+            _freeze(kwargs.get("aggregate_time")),
+            tuple(sorted(
+                (k, _freeze(v)) for k, v in kwargs.items()
+                if k not in ["groupby", "aggregate_time"]
+            )),
+        )
+        if key in self._cache:
+            self.hits += 1
+            result = self._cache[key]
+        else:
+            self.misses += 1
+            result = self._from_balance(metric, bus_carrier, kwargs)
+            if result is None:
+                result = getattr(self.n.statistics, metric)(
+                    bus_carrier=bus_carrier,
+                    **kwargs,
+                )
+            self._cache[key] = result
+
+        if region is None:
+            return result
+        return self._split_regions(key, result).get(region, result.iloc[:0])
+
+    def supply(self, bus_carrier=None, aggregate_time="sum", **kwargs):
+        return self._get(
+            "supply",
+            bus_carrier=bus_carrier,
+            aggregate_time=aggregate_time,
+            **kwargs,
+        )
+
+    def withdrawal(self, bus_carrier=None, aggregate_time="sum", **kwargs):
+        return self._get(
+            "withdrawal",
+            bus_carrier=bus_carrier,
+            aggregate_time=aggregate_time,
+            **kwargs,
+        )
+
+    def curtailment(self, bus_carrier=None, aggregate_time="sum", **kwargs):
+        return self._get(
+            "curtailment",
+            bus_carrier=bus_carrier,
+            aggregate_time=aggregate_time,
+            **kwargs,
+        )
+
+    def optimal_capacity(self, bus_carrier=None, **kwargs):
+        # optimal_capacity has no time dimension, hence no aggregate_time
+        return self._get(
+            "optimal_capacity",
+            bus_carrier=bus_carrier,
+            **kwargs,
+        )
+
+    def summary(self):
+        total = self.hits + self.misses
+        return (
+            f"Statistics cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hits / total if total else 0:.0%} reused)"
+        )
@@ -0,0 +1,73 @@
+"""
+Time-resolved export of the registered variables (see _registry.py).
+
+Instead of annual sums, the variables are evaluated per snapshot and
+summed into sub-annual periods (months, seasons, hours of typical days or
+the snapshots themselves), labelled like the "Subannual" column of the
+IAMC format. The snapshots are processed in chunks, so only one chunk of
+the time series is in memory at a time.
+"""
+import pandas as pd
+
+from _aggregation import aggregate
+from _registry import evaluate_registry_t
+from _utils import snapshot_chunks
+
+
+RESOLUTIONS = ["snapshot", "month", "season", "typical day"]
+
+SEASONS = {
+    12: "Winter", 1: "Winter", 2: "Winter",
+    3: "Spring", 4: "Spring", 5: "Spring",
+    6: "Summer", 7: "Summer", 8: "Summer",
+    9: "Autumn", 10: "Autumn", 11: "Autumn",
+}
+
+
+def get_periods(snapshots, resolution):
+    # Sub-annual period of every snapshot
+    snapshots = pd.DatetimeIndex(snapshots)
+    if resolution == "snapshot":
+        return snapshots.strftime("%Y-%m-%d %H:%M")
+    if resolution == "month":
+        return snapshots.month_name()
+    seasons = snapshots.month.map(SEASONS)
+    if resolution == "season":
+        return seasons
+    if resolution == "typical day":
+        return seasons + snapshots.strftime(" %H:%M")
+    raise ValueError(f"Unknown time resolution {resolution!r}")
+
+
+def get_registered_t(n, resolution="month", chunk_size=None):
+    """
+    The registered energy variables of `n` per sub-annual period, as a
+    DataFrame Variable x (Region, Subannual), including their parents.
+
+    Periods are sums of the weighted energy of their snapshots, so they add
+    up to the annual value. A typical day of a season holds, per hour of
+    the day, the season's energy divided by the number of days the season
+    represents (from the snapshot weightings).
+    """
+    sums = []
+    for snapshots in snapshot_chunks(n, chunk_size):
+        var = evaluate_registry_t(n, snapshots)
+        sums.append(var.T.groupby([
+            var.columns.get_level_values("Region"),
+            get_periods(var.columns.get_level_values("snapshot"), resolution),
+        ], sort=False).sum())
+    var = pd.concat(sums).groupby(level=[0, 1], sort=False).sum().T
+    var.columns.names = ["Region", "Subannual"]
+
+    if resolution == "typical day":
+        weightings = n.snapshot_weightings.generators
+        days = weightings.groupby(
+            pd.DatetimeIndex(n.snapshots).month.map(SEASONS).values
+        ).sum() / 24
+        var = var.div(
+            days.reindex(
+                var.columns.get_level_values("Subannual").str.split().str[0]
+            ).values
+        )
+
+    return aggregate(var)
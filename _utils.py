@@ -1,3 +1,8 @@
+import re
+import numpy as np
+import pandas as pd
+from weakref import WeakKeyDictionary
+
 MW2GW = 1e-3
 t2Mt = 1e-6
 MWh2PJ = 3.6e-6
@@ -5,6 +10,110 @@ MWh2PJ = 3.6e-6
 
 # %% more helpers
 
+def add_regions(n):
+    """
+    Add a categorical column `region` to the buses and to all one-port and
+    branch components of the network, unless it is already there.
+
+    The region of a bus is the country of its location, e.g. "DE1 0 H2" is
+    in DE because "DE1 0" is, or its own country if it has no location. A
+    component gets the region of its first bus which has a country, e.g.
+    "DE1 0 oil" (EU oil -> DE1 0) is assigned to DE. Buses and components
+    without country get "".
+    Comparing the categorical column to a region only compares integer 
+    codes, and, unlike substring matching on names, cannot mismatch.
+    """
+    if "region" in n.buses:
+        return
+
+    country = n.buses.get(
+        "country", pd.Series("", index=n.buses.index)
+    ).fillna("")
+    if "location" in n.buses:
+        # Only electricity buses have a country in sector-coupled networks
+        country = n.buses.location.map(country).fillna("").where(
+            lambda location_country: location_country != "", country
+        )
+    categories = sorted(set(country) - {""}) + [""]
+    n.buses["region"] = pd.Categorical(country, categories=categories)
+
+    for c in n.branch_components | n.one_port_components:
+        df = n.df(c)
+        region = pd.Series("", index=df.index)
+        # Go through the buses backwards, such that the first bus wins
+        for col in sorted(
+            [col for col in df if col.startswith("bus")],
+            key=lambda col: int(col[3:] or 0),
+            reverse=True,
+        ):
+            bus_region = df[col].map(n.buses.region).astype(object).fillna("")
+            region = region.where(bus_region == "", bus_region)
+        df["region"] = pd.Categorical(region, categories=categories)
+
+
+def get_component_regions(n):
+    # Region of every component, indexed by (component, name)
+    add_regions(n)
+    return pd.concat(
+        {c: n.df(c).region for c in n.branch_components | n.one_port_components},
+        names=["component", "name"],
+    )
+
+
+def get_bus_regions(n, buses):
+    add_regions(n)
+    return pd.Index(buses).map(n.buses.region)
+
+
+def weighted_sum(weights, df, transform=None, chunk_size=None):
+    """
+    `weights @ transform(df)` for time series `df` (snapshots x columns),
+    computed over chunks of `chunk_size` snapshots (default: all at once)
+    and accumulated per column. `transform` is applied to one chunk at a
+    time, so temporaries like weighted or clipped time series only hold one
+    chunk. If `transform` returns a list of frames, e.g. the positive and
+    negative part of a chunk, a list of sums is returned and `df` is still
+    only read once.
+    """
+    size = chunk_size or max(len(df), 1)
+    weights = weights.reindex(df.index)
+    totals = None
+    # At least one, possibly empty, chunk, such that the result has the
+    # columns of the transformed time series
+    for start in range(0, max(len(df), 1), size):
+        chunk = df.iloc[start:start + size]
+        if transform is not None:
+            chunk = transform(chunk)
+        several = isinstance(chunk, list)
+        parts = [
+            weights.iloc[start:start + size] @ part
+            for part in (chunk if several else [chunk])
+        ]
+        totals = parts if totals is None else [
+            total + part for total, part in zip(totals, parts)
+        ]
+    return totals if several else totals[0]
+
+
+def is_selected(series, list_name, attr):
+    # Whether `series`, e.g. _network.EXPORT_SERIES, selects the time series
+    # `attr` of the components `list_name`. None selects all time series.
+    if series is None:
+        return True
+    patterns = series.get(list_name, []) + series.get("*", [])
+    return any(re.fullmatch(pattern, attr) for pattern in patterns)
+
+
+def snapshot_chunks(n, chunk_size=None):
+    # Consecutive slices of the snapshots with at most `chunk_size`
+    # snapshots each, or all snapshots at once without `chunk_size`
+    if not chunk_size:
+        yield n.snapshots
+        return
+    for start in range(0, len(n.snapshots), chunk_size):
+        yield n.snapshots[start:start + chunk_size]
+
+
 
 
 
@@ -19,32 +128,82 @@ def get_CHP_elec_fraction(n, carrier, region):
 
     return elec_output / (elec_output + heat_output)
 
-def _get_t_sum(df, df_t, carrier, region, snapshot_weightings, port):
-    if type(carrier) == list:
-        return sum(
-            [
-                _get_t_sum(
-                    df, df_t, car, region, snapshot_weightings, port
-                ) for car in carrier
-            ]            
+def get_weighted_sums(n, chunk_size=None):
+    """
+    Weighted sum over all snapshots of every column of the power time series
+    (p, p0, p1, ...) of all components, as a dict {(component, port): Series}.
+
+    Computed once per network, with one product `weights @ p` per port and
+    chunk of `chunk_size` snapshots (see `weighted_sum`).
+    """
+    if n not in _weighted_sums:
+        weights = n.snapshot_weightings.generators
+        _weighted_sums[n] = {
+            (c, port): weighted_sum(weights, p, chunk_size=chunk_size)
+            for c in n.branch_components | n.one_port_components
+            for port, p in n.pnl(c).items()
+            if re.fullmatch(r"p\d*", port) and not p.columns.empty
+        }
+    return _weighted_sums[n]
+
+_weighted_sums = WeakKeyDictionary()
+
+
+def get_annual_energy(n):
+    """
+    Weighted annual energy of all components at all ports as a Series indexed
+    by (component, port, carrier, region).
+
+    Computed once per network from `get_weighted_sums`, such that the sum_*
+    helpers below are lookups of the requested entries.
+    """
+    if n not in _annual_energy:
+        add_regions(n)
+        energy = {}
+        for (c, port), sums in get_weighted_sums(n).items():
+            df = n.df(c)
+            energy[c, port] = sums.groupby([
+                df.carrier[sums.index],
+                df.region[sums.index].astype(str),
+            ]).sum()
+        _annual_energy[n] = pd.concat(
+            energy, names=["component", "port", "carrier", "region"],
         )
-    idx = df[df.carrier == carrier].filter(like=region, axis=0).index
-
-    return df_t[port][idx].multiply(
-        snapshot_weightings,
-        axis=0,
-    ).values.sum()
+    return _annual_energy[n]
+
+_annual_energy = WeakKeyDictionary()
+
+
+def get_t_sums(n, c, requests, region):
+    """
+    Weighted annual sums of the component `c` for many (carrier, port)
+    requests at once, e.g. [("OCGT", "p2"), (["coal", "lignite"], "p2")].
+
+    Lists of carriers are added up, carriers without assets in the region
+    contribute 0.
+    """
+    requests = [
+        (carrier if type(carrier) == list else [carrier], port)
+        for carrier, port in requests
+    ]
+    values = get_annual_energy(n).reindex(
+        [
+            (c, port, car, region)
+            for carrier, port in requests for car in carrier
+        ],
+        fill_value=0,
+    ).values
+    bounds = np.cumsum([0] + [len(carrier) for carrier, _ in requests])
+    return [
+        values[start:stop].sum() for start, stop in zip(bounds, bounds[1:])
+    ]
+
+def _get_t_sum(n, c, carrier, region, port):
+    return get_t_sums(n, c, [(carrier, port)], region)[0]
 
 
 def sum_link_input(n, carrier, region, port="p0"):
-    return MWh2PJ * _get_t_sum(
-        n.links,
-        n.links_t,
-        carrier,
-        region,
-        n.snapshot_weightings.generators,
-        port,
-    )
+    return MWh2PJ * _get_t_sum(n, "Link", carrier, region, port)
 
 def sum_link_output(n, carrier, region, port="p1"):
     return -1 * sum_link_input(
@@ -55,60 +214,71 @@ def sum_link_output(n, carrier, region, port="p1"):
     )
 
 def sum_load(n, carrier, region):
-    return MWh2PJ * _get_t_sum(
-        n.loads,
-        n.loads_t,
-        carrier,
-        region,
-        n.snapshot_weightings.generators,
-        "p",
-    )   
+    return MWh2PJ * _get_t_sum(n, "Load", carrier, region, "p")
 
 def sum_generator_output(n, carrier, region):
-    return -1 * MWh2PJ * _get_t_sum(
-        n.generators,
-        n.generators_t,
-        carrier,
-        region,
-        n.snapshot_weightings.generators,
-        "p",
-    )
+    return -1 * MWh2PJ * _get_t_sum(n, "Generator", carrier, region, "p")
 
 def sum_storage_unit_output(n, carrier, region):
-    return -1 * MWh2PJ * _get_t_sum(
-        n.storage_units,
-        n.storage_units_t,
-        carrier,
-        region,
-        n.snapshot_weightings.generators,
-        "p",
-    )
+    return -1 * MWh2PJ * _get_t_sum(n, "StorageUnit", carrier, region, "p")
+
+def get_emitters(n):
+    """
+    Emitter index of the network: one row for every link port connected to
+    "co2 atmosphere" or "co2 stored", with the carrier and region of the
+    link and the weighted annual flow at that port (in t, positive means
+    the link withdraws CO2 from the bus). Built once per network.
+    """
+    if n not in _emitters:
+        add_regions(n)
+        df = n.links
+        emitters = []
+        for port in [col[3:] for col in df if col.startswith("bus")]:
+            links = df.index[
+                df[f"bus{port}"].isin(["co2 atmosphere", "co2 stored"])
+            ]
+            if links.empty:
+                continue
+            emitters.append(pd.DataFrame({
+                "port": port,
+                "bus": df.loc[links, f"bus{port}"],
+                "carrier": df.loc[links, "carrier"],
+                "region": df.loc[links, "region"].astype(str),
+                "flow": get_weighted_sums(n).get(
+                    ("Link", f"p{port}"), pd.Series(dtype=float),
+                ).reindex(links, fill_value=0),
+            }))
+        _emitters[n] = pd.concat(emitters) if emitters else pd.DataFrame(
+            columns=["port", "bus", "carrier", "region", "flow"],
+        )
+    return _emitters[n]
+
+_emitters = WeakKeyDictionary()
+
+
+def get_co2_emissions(n):
+    # Emissions to the atmosphere in Mt per (carrier, region), from a single
+    # groupby of the emitter index
+    if n not in _co2_emissions:
+        emitters = get_emitters(n).query("bus == 'co2 atmosphere'")
+        _co2_emissions[n] = -1 * t2Mt * emitters.groupby(
+            ["carrier", "region"]
+        ).flow.sum()
+    return _co2_emissions[n]
+
+_co2_emissions = WeakKeyDictionary()
+
 
 def sum_co2(n, carrier, region):
-    if type(carrier) == list:
-        return sum([sum_co2(n, car, region) for car in carrier])
-    try:
-        port = n.links.groupby(
-            "carrier"
-        ).first().loc[
-            carrier
-        ].filter(
-            like="bus"
-        ).tolist().index("co2 atmosphere")
-    except KeyError:
+    if type(carrier) != list:
+        carrier = [carrier]
+    for car in set(carrier).difference(n.links.carrier):
         print(
-            "Warning: carrier `", carrier, "` not found in network.links.carrier!",
+            "Warning: carrier `", car, "` not found in network.links.carrier!",
             sep="")
-        return 0
-
-    return -1 * t2Mt * _get_t_sum(
-        n.links,
-        n.links_t,
-        carrier,
-        region,
-        n.snapshot_weightings.generators,
-        f"p{port}",
-    )
+    return get_co2_emissions(n).reindex(
+        [(car, region) for car in carrier], fill_value=0,
+    ).sum()
 
 
 #%% CO2
@@ -116,84 +286,36 @@ def sum_co2(n, carrier, region):
 # n50.statistics.withdrawal(bus_carrier="co2", groupby=groupby).filter(like="DE").groupby("carrier").sum()
 def get_co2(n, carrier, region):
     # including international bunker fuels and negative emissions
-    if type(carrier) == list:
-        return sum([get_co2(n, car, region) for car in carrier])
-    
-    df = n.links[n.links.carrier == carrier].filter(like=region, axis=0)
-
-    co2 = 0
-    for port in [col[3:] for col in df if col.startswith("bus")]:
-        links = df.index[df[f"bus{port}"] == "co2 atmosphere"]
-        co2 -= n.links_t[f"p{port}"][links].multiply(
-            n.snapshot_weightings.generators,
-            axis=0,
-        ).values.sum()
-    return t2Mt * co2
+    if type(carrier) != list:
+        carrier = [carrier]
+    return get_co2_emissions(n).reindex(
+        [(car, region) for car in carrier], fill_value=0,
+    ).sum()
 
 
 
 def get_link_production(n, carrier, region):
-    if type(carrier) == list:
-        return sum(
-            [get_link_production(n, car, region) for car in carrier]
-        )
-    
-    df = n.links[n.links.carrier == carrier].filter(
-        like=region, 
-        axis=0,
-    )
-
-    return -1 * MWh2PJ * n.links_t.p1[df.index].multiply(
-        n.snapshot_weightings.generators,
-        axis=0,
-    ).values.sum()
+    return sum_link_output(n, carrier, region)
 
 
 def get_load_consumption(n, carrier, region):
-    if type(carrier) == list:
-        return sum(
-            [get_load_consumption(n, car, region) for car in carrier]
-        )
-    
-    df = n.loads[n.loads.carrier == carrier].filter(
-        like=region, 
-        axis=0,
-    )
-
-    return MWh2PJ * n.loads_t.p[df.index].multiply(
-        n.snapshot_weightings.generators,
-        axis=0,
-    ).values.sum()
+    return sum_load(n, carrier, region)
 
 
 
 def get_link_consumption(n, carrier, region):
-    if type(carrier) == list:
-        return sum(
-            [get_link_consumption(n, car, region) for car in carrier]
-        )
-    
-    df = n.links[n.links.carrier == carrier].filter(
-        like=region, 
-        axis=0,
-    )
-
-    return MWh2PJ * n.links_t.p0[df.index].multiply(
-        n.snapshot_weightings.generators,
-        axis=0,
-    ).values.sum()
+    return sum_link_input(n, carrier, region)
 
 
 
 
 
 def get_all_emitters(n):
-    df = n.links
-    carriers = []
-    for port in [col[3:] for col in df if col.startswith("bus")]:
-        links = df.index[df[f"bus{port}"] == "co2 atmosphere"]
-        carriers.append(df.loc[links].carrier.unique())
-    return carriers
+    emitters = get_emitters(n).query("bus == 'co2 atmosphere'")
+    return [
+        emitters.carrier[emitters.port == port].unique()
+        for port in [col[3:] for col in n.links if col.startswith("bus")]
+    ]
 
 def get_all_carriers_to_bus(n, bus):
     df = n.links
@@ -206,21 +328,11 @@ def get_all_carriers_to_bus(n, bus):
 
 def get_total_co2(n, region):
     # including international bunker fuels and negative emissions 
-    df = n.links.filter(like=region, axis=0)
-    co2 = 0
-    for port in [col[3:] for col in df if col.startswith("bus")]:
-        links = df.index[df[f"bus{port}"] == "co2 atmosphere"]
-        co2 -= n.links_t[f"p{port}"][links].multiply(
-            n.snapshot_weightings.generators,
-            axis=0,
-        ).values.sum()
-    return t2Mt * co2
-
+    emissions = get_co2_emissions(n)
+    return emissions[
+        emissions.index.get_level_values("region") == region
+    ].sum()
 
-def get_cols(df, carrier, like="bus"):
-    return df[
-        df.carrier.str.contains(carrier)
-    ].filter(like=like)
 
 #%%
 
@@ -231,9 +343,8 @@ def get_cols(df, carrier, like="bus"):
 def get_capacity(_df, label, region):
     if type(label) == list:
         return sum(map(lambda lab: get_capacity(_df, lab, region), label))
-    # Would be nice to have an explicit column for the region, not just implicit
-    # location derived from the index name
-    df = _df[_df.carrier==label].filter(like=region, axis=0)
+    # Requires the region column, see add_regions
+    df = _df[(_df.carrier == label) & (_df.region == region)]
     if "CHP" in label:
         print("Warning: Returning electrical capacity of the CHP, not thermal.")
     if df.index.name == "Link":
@@ -251,7 +362,7 @@ def get_reservoir_capacity(_df, label, region):
     if type(label) == list:
         return sum(map(lambda lab: get_reservoir_capacity(_df, lab, region), label))
 
-    df = _df[_df.carrier == label].filter(like=region, axis=0)
+    df = _df[(_df.carrier == label) & (_df.region == region)]
     if df.index.name == "Store":
         return MW2GW * df.e_nom_opt.sum()
     elif df.index.name == "StorageUnit":
@@ -263,10 +374,11 @@ def get_reservoir_capacity(_df, label, region):
 # n.statistics.optimal_capacity( storage=True).loc["Store"]
     
 def get_line_capacity(n, region):
+    add_regions(n)
     AC_capacity = (
         0.5 * (
-            n.lines.bus0.str.contains(region).astype(float) + 
-            n.lines.bus1.str.contains(region).astype(float)
+            (n.lines.bus0.map(n.buses.region) == region).astype(float) + 
+            (n.lines.bus1.map(n.buses.region) == region).astype(float)
         ) * n.lines.length.multiply(n.lines.s_nom_opt)
     ).sum()
 
@@ -275,8 +387,8 @@ def get_line_capacity(n, region):
     DC_links = _DC_links[~_DC_links.index.str.contains("-reversed")]
     DC_capacity = (
         0.5 * (
-            DC_links.bus0.str.contains(region).astype(float) + 
-            DC_links.bus1.str.contains(region).astype(float)
+            (DC_links.bus0.map(n.buses.region) == region).astype(float) + 
+            (DC_links.bus1.map(n.buses.region) == region).astype(float)
         ) * DC_links.length.multiply(DC_links.p_nom_opt)
     ).sum()
 
@@ -293,7 +405,7 @@ def get_capacityN(_df, label, region, N=2):
     if type(label) == list:
         return sum(map(lambda lab: get_capacityN(_df, lab, region, N=N), label))
 
-    df = _df[_df.carrier==label].filter(like=region, axis=0)
+    df = _df[(_df.carrier == label) & (_df.region == region)]
     if df.index.name == "Link":
         return MW2GW * df.p_nom_opt.multiply(df["efficiency{}".format(N)]).sum()
     else:
@@ -0,0 +1,108 @@
+"""
+Consistency checks of the exported variables.
+
+Getters record their checks in a Validator instead of asserting, so that a
+failing check does not stop a batch run. All checks of a run are evaluated
+at once in `Validator.report`.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Severity of checks by name (regular expressions, first match wins),
+# overriding the severity given where the check is recorded
+SEVERITY = {
+    r"^Aggregation\|": "warning",
+}
+
+
+class Validator:
+    """
+    Collects checks (name, actual, expected, severity), labelled e.g. with
+    scenario, year and region.
+
+    With `strict=True`, failing checks of severity "error" raise an
+    AssertionError immediately, as when a getter is called on its own.
+    """
+
+    def __init__(self, rtol=1e-5, atol=1e-8, severity=SEVERITY, strict=False,
+                 **labels):
+        self.rtol = rtol
+        self.atol = atol
+        self.severity = severity
+        self.strict = strict
+        self.labels = labels
+        self.checks = []
+
+    def child(self, **labels):
+        # Same settings and labels plus `labels`, but its own list of checks
+        return Validator(
+            self.rtol, self.atol, self.severity, self.strict,
+            **{**self.labels, **labels},
+        )
+
+    def _severity(self, name, default):
+        for pattern, severity in self.severity.items():
+            if re.search(pattern, name):
+                return severity
+        return default
+
+    def isclose(self, name, actual, expected, severity="error"):
+        severity = self._severity(name, severity)
+        if self.strict and severity == "error":
+            assert np.isclose(
+                actual, expected, rtol=self.rtol, atol=self.atol,
+            ), f"{name}: {actual} != {expected}"
+        self.checks.append({
+            **self.labels,
+            "name": name,
+            "actual": actual,
+            "expected": expected,
+            "severity": severity,
+        })
+
+    def check(self, name, condition, severity="error"):
+        self.isclose(name, float(bool(condition)), 1.0, severity)
+
+    def add_aggregation_report(self, report):
+        # Parents which differ from the sum of their children, as found by
+        # _aggregation.aggregate
+        for row in report.itertuples():
+            checks = self.child(region=row.Region)
+            checks.isclose(
+                f"Aggregation|{row.Variable}",
+                row.reported,
+                row.aggregated,
+                severity="warning",
+            )
+            self.checks.extend(checks.checks)
+
+    def report(self):
+        """
+        All checks as a DataFrame with a column `passed`, evaluated in one
+        vectorized comparison.
+        """
+        report = pd.DataFrame(self.checks)
+        if report.empty:
+            report = pd.DataFrame(
+                columns=[*self.labels, "name", "actual", "expected", "severity"],
+            )
+        report["passed"] = np.isclose(
+            pd.to_numeric(report.actual, errors="coerce"),
+            pd.to_numeric(report.expected, errors="coerce"),
+            rtol=self.rtol,
+            atol=self.atol,
+            equal_nan=True,
+        )
+        return report
+
+
+def summarize(report):
+    # e.g. "Checks: 120 passed, 2 errors, 5 warnings failed"
+    failed = report[~report.passed].severity.value_counts()
+    return "Checks: {} passed{}".format(
+        report.passed.sum(),
+        "".join(f", {count} {severity} failed" for severity, count in failed.items()),
+    )
@@ -0,0 +1,210 @@
+"""
+Streaming output of the exported variables.
+
+Results are appended per (scenario, year) as soon as they are computed,
+such that a crash only loses the work item that was running. Rows are kept
+in long format (Model, Scenario, Region, Variable, Unit, [Subannual,] Year,
+Value) until the run is complete, and then written in the IAMC layout with
+one column per year.
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+
+
+INDEX = ["Model", "Scenario", "Region", "Variable", "Unit"]
+COLUMNS = [*INDEX, "Year", "Value"]
+
+
+def to_long(tab):
+    # Series indexed by INDEX (and Subannual) and named by the year -> long
+    # DataFrame
+    return tab.rename("Value").reset_index().assign(Year=tab.name)[
+        [*tab.index.names, "Year", "Value"]
+    ]
+
+
+def to_iamc(long, variables=None):
+    """
+    The long table in the IAMC layout, one row per Model x Scenario x Region
+    x Variable x Unit and one column per year. With `variables`, e.g. the
+    index of the template, rows are sorted by model, scenario and region,
+    and ordered like the template within each of them.
+    """
+    index = [col for col in long if col not in ["Year", "Value"]]
+    values = long.set_index([*index, "Year"]).Value
+    # Rows in the order they were written
+    wide = values.unstack("Year").reindex(
+        values.index.droplevel("Year").unique()
+    ).sort_index(axis=1)
+    wide.columns.name = None
+    if variables is not None:
+        order = pd.Index(variables).get_indexer(
+            wide.index.get_level_values("Variable")
+        )
+        # Variables which are not in the template go last
+        order[order < 0] = len(variables)
+        keys = wide.index.to_frame(index=False)[
+            ["Model", "Scenario", "Region"]
+        ].assign(order=order)
+        wide = wide.iloc[
+            keys.sort_values([*keys], kind="stable").index
+        ]
+    return wide.reset_index()
+
+
+class CsvStore:
+    """
+    Long rows in a single CSV file. Every work item is appended with a
+    single write and flushed to disk.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def written(self):
+        # Set of (scenario, year, region) in the file
+        try:
+            done = pd.read_csv(
+                self.path, usecols=["Scenario", "Year", "Region"],
+                dtype=str, keep_default_na=False,
+            )
+        except FileNotFoundError:
+            return set()
+        return set(
+            done[["Scenario", "Year", "Region"]].itertuples(
+                index=False, name=None,
+            )
+        )
+
+    def append(self, long):
+        header = not self.path.exists()
+        with open(self.path, "a") as f:
+            f.write(long.to_csv(index=False, header=header))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self):
+        return pd.read_csv(self.path, keep_default_na=False, na_values=[""])
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+class ParquetStore:
+    """
+    Long rows in a parquet dataset partitioned by scenario and year, e.g.
+    `path/Scenario=.../Year=2030/part-0.parquet`. Scenario and year are only
+    stored in the directory names. Every work item is one file, which is
+    renamed into place once it is complete.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _partition(self, scenario, year):
+        return self.path / f"Scenario={scenario}" / f"Year={year}"
+
+    def written(self):
+        done = set()
+        for file in self.path.glob("Scenario=*/Year=*/part-*.parquet"):
+            scenario = file.parent.parent.name.split("=", 1)[1]
+            year = file.parent.name.split("=", 1)[1]
+            regions = pd.read_parquet(file, columns=["Region"]).Region
+            done.update(
+                (scenario, year, region) for region in regions.unique()
+            )
+        return done
+
+    def append(self, long):
+        for (scenario, year), rows in long.groupby(
+            ["Scenario", "Year"], sort=False,
+        ):
+            partition = self._partition(scenario, year)
+            partition.mkdir(parents=True, exist_ok=True)
+            parts = len(list(partition.glob("part-*.parquet")))
+            file = partition / f"part-{parts}.parquet"
+            tmp = file.with_suffix(f".{os.getpid()}.tmp")
+            rows.drop(columns=["Scenario", "Year"]).to_parquet(
+                tmp, index=False,
+            )
+            os.replace(tmp, file)
+
+    def read(self):
+        parts = [
+            pd.read_parquet(file).assign(
+                Scenario=file.parent.parent.name.split("=", 1)[1],
+                Year=int(file.parent.name.split("=", 1)[1]),
+            ) for file in
+            sorted(self.path.glob("Scenario=*/Year=*/part-*.parquet"))
+        ]
+        if not parts:
+            return pd.DataFrame(columns=COLUMNS)
+        long = pd.concat(parts, ignore_index=True)
+        # e.g. Subannual, between Unit and Year like in `to_long`
+        extra = [col for col in long if col not in COLUMNS]
+        return long[[*INDEX, *extra, "Year", "Value"]]
+
+    def clear(self):
+        for file in self.path.glob("Scenario=*/Year=*/part-*.parquet"):
+            file.unlink()
+
+
+class IamcWriter:
+    """
+    Writes the results of a run to `path`, depending on its suffix
+
+    - .csv: IAMC layout, one column per year
+    - .xlsx: IAMC layout on the sheet "data", like the Ariadne template
+    - anything else: long parquet dataset partitioned by scenario and year
+
+    CSV and xlsx are streamed to a long CSV next to `path` first, which is
+    removed once `close` wrote the final file. With `resume=True`, results
+    which are already streamed are kept and can be skipped (see `written`).
+    """
+
+    def __init__(self, path, resume=False, variables=None):
+        self.path = Path(path)
+        self.variables = variables
+        if self.path.suffix in (".csv", ".xlsx"):
+            self.store = CsvStore(
+                self.path.with_name(f".{self.path.name}.partial.csv")
+            )
+        else:
+            self.store = ParquetStore(self.path)
+        if not resume:
+            self.store.clear()
+        # (scenario, year, region), with the year as string
+        self._written = self.store.written()
+
+    def written(self, scenario, year):
+        # Regions already written for the scenario and year
+        return {
+            r for s, y, r in self._written if s == scenario and y == str(year)
+        }
+
+    def write(self, tab):
+        # A Series indexed by Model x Scenario x Region x Variable x Unit,
+        # named by the year
+        long = to_long(tab)
+        self.store.append(long)
+        self._written.update(
+            (s, str(y), r) for s, y, r in
+            long[["Scenario", "Year", "Region"]].drop_duplicates().itertuples(
+                index=False, name=None,
+            )
+        )
+
+    def close(self):
+        """
+        Write the final file and return all results in the IAMC layout.
+        """
+        wide = to_iamc(self.store.read(), self.variables)
+        if self.path.suffix == ".csv":
+            wide.to_csv(self.path, index=False)
+        elif self.path.suffix == ".xlsx":
+            wide.to_excel(self.path, sheet_name="data", index=False)
+        if isinstance(self.store, CsvStore):
+            self.store.clear()
+        return wide
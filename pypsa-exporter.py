@@ -8,12 +8,26 @@ Thanks to @martavp. Adapted from https://github.com/martavp/pypsa-eur-sec-to-ipc
 #%%
 import pypsa
 import pandas as pd
+import numpy as np
 from itertools import product
-from functools import reduce
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import os
 from pathlib import Path
 from _utils import *
 from _getters import *
+from _network import (
+    NetworkPool, get_peak_memory, load_network, reset_peak_memory,
+)
+from _aggregation import aggregate
+from _validation import Validator, summarize
+from _writer import IamcWriter
+from _inputs import load_energy_totals, load_industry_demand
+from _timeseries import RESOLUTIONS, get_registered_t
+from _cache import (
+    ResultCache, file_digest, frame_digest, getter_digest, load_template,
+)
 import yaml
 
 
@@ -26,6 +40,88 @@ t2Mt = 1e-6
 
 #%%
 
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of processes evaluating (scenario, year) pairs in parallel",
+)
+parser.add_argument(
+    "--regions",
+    nargs="+",
+    default=["DE"],
+    help="Regions to export, or 'all' for every country in the network",
+)
+parser.add_argument(
+    "--sidecar",
+    action="store_true",
+    help="Memory-map the annual sums of each network from a sidecar next "
+    "to the .nc file, written on the first run. Not used with "
+    "--time-resolution, which needs the time series",
+)
+parser.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="Evaluate all getters, instead of reusing cached results of "
+    "getters whose code and inputs did not change",
+)
+parser.add_argument(
+    "--cache-dir",
+    default=".exporter_cache",
+    help="Directory of the result cache, relative to the project directory",
+)
+parser.add_argument(
+    "--cache-size",
+    type=float,
+    default=1024,
+    help="Maximum size of the result cache in MB",
+)
+parser.add_argument(
+    "--memory-budget",
+    type=float,
+    default=0,
+    help="Memory in MB for loaded networks per process. Least recently used "
+    "networks are evicted beyond it, with 0 only the current one is kept",
+)
+parser.add_argument(
+    "--time-resolution",
+    choices=RESOLUTIONS,
+    help="Additionally export the energy variables of the registry per "
+    "snapshot, month, season or hour of a typical day (Subannual column)",
+)
+parser.add_argument(
+    "--snapshot-chunk",
+    type=int,
+    help="Number of snapshots processed at once, for the annual sums and "
+    "with --time-resolution, such that memory scales with the chunk instead "
+    "of the time horizon. All at once by default",
+)
+parser.add_argument(
+    "--output",
+    default="/home/micha/git/pypsa-exporter/pypsa_output.csv",
+    help="Output file, .csv or .xlsx (IAMC layout), or a directory for a "
+    "parquet dataset partitioned by scenario and year",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Keep the results already written by an interrupted run and only "
+    "evaluate the missing (scenario, year, region) combinations",
+)
+parser.add_argument(
+    "--interactive",
+    action="store_true",
+    help="Do not export, but load the network of --year of the first "
+    "scenario and its inputs for debugging, e.g. with "
+    "`python -i pypsa-exporter.py --interactive`",
+)
+parser.add_argument(
+    "--year",
+    type=int,
+    help="Planning horizon loaded with --interactive, defaults to the first",
+)
+
 project_dir = "/home/micha/git/pypsa-ariadne/"
 snakefile = project_dir + "/workflow/Snakefile"
 configfile = project_dir + "results/240219-test/normal/config.yaml"
@@ -43,16 +139,28 @@ template_path = Path(__file__).parent /  "2024-01-31_template_Ariadne.xlsx"
 # Metadata
 model = "PyPSA-Ariadne v" + config['version']
 
-keys, values = zip(*config['scenario'].items())
-permutations_dicts = [dict(zip(keys, v)) for v in product(*values)]
-scenarios = []
-for scenario_i in permutations_dicts:
-    scenarios.append(
-        "elec_s{simpl}_{clusters}_l{ll}_{opts}_{sector_opts}_".format(
-            **scenario_i
-        )
+def get_scenario_name(scenario_i):
+    return "elec_s{simpl}_{clusters}_l{ll}_{opts}_{sector_opts}_".format(
+        **scenario_i
     )
-scenario = scenarios[0]
+
+
+def get_network_path(scenario_i, year):
+    return "results/{run}/postnetworks/{scenario}{year}.nc".format(
+        run=config['run']['name'][0],
+        scenario=get_scenario_name(scenario_i),
+        year=year,
+    )
+
+keys, values = zip(*[
+    (key, value) for key, value in config['scenario'].items()
+    # planning horizons become columns of the table, not separate scenarios
+    if key != "planning_horizons"
+])
+permutations_dicts = [dict(zip(keys, v)) for v in product(*values)]
+scenarios = [
+    get_scenario_name(scenario_i) for scenario_i in permutations_dicts
+]
 
 
 #%%
@@ -62,75 +170,209 @@ output_folder = project_dir +'results/'
 years = config['scenario']['planning_horizons']
 
 # %%
+# All variable definitions of the template (Unit, Definition, ...), parsed
+# from the xlsx only when it changed
+template = load_template(template_path)
+
 # A mapping of variable names to the corresponding units, extracted from the template
-var2unit = pd.read_excel(
-    template_path, 
-    sheet_name="variable_definitions",
-    index_col="Variable",
-)["Unit"]
+var2unit = template["Unit"]
  
 
 
 #%%
 
-def get_ariadne_var(n, industry_demand, energy_totals, region):
-
-    var = pd.concat([
-        get_capacities_electricity(n,region),
-        get_capacities_heat(n,region),
-        get_capacities_other(n,region),
-        get_primary_energy(n, region),
-        get_secondary_energy(n, region),
-        get_final_energy(n, region, industry_demand, energy_totals),
-        #get_prices(n,region), 
-        #get_emissions
-    ])
+def get_ariadne_var(
+    n, industry_demand, energy_totals, regions, cache=None, network_digest=None,
+    checks=None,
+):
+    # `n` is the network, or a function loading it. With a result cache, the
+    # function is only called once a getter is not cached, such that a run
+    # where all results are cached never loads the network.
+    loaded = {}
+
+    def network():
+        if not loaded:
+            loaded["n"] = n() if callable(n) else n
+            # All getters share one statistics cache, such that statistics
+            # which are needed in several getters or regions are only
+            # computed once per network and split into regions in one go
+            loaded["stats"] = CachedStatistics(loaded["n"])
+        return loaded["n"], loaded["stats"]
+
+    # Failing checks are collected instead of stopping the export
+    if checks is None:
+        checks = Validator()
+
+    if regions == "all" or regions == ["all"]:
+        # The regions of a network are cached like the getter results
+        key = None if cache is None else cache.key(network_digest, "regions")
+        regions = None if cache is None else cache.get(key)
+        if regions is None:
+            regions = network()[1].regions
+            if cache is not None:
+                cache.put(key, regions)
+    elif isinstance(regions, str):
+        regions = [regions]
+
+    def run(getter, region, inputs, local):
+        n, stats = network()
+        return getter(n, region, *inputs, stats, local)
+
+    # With a result cache, a getter is only evaluated if its code, the
+    # network or its inputs changed since the last run. Its checks are
+    # cached with the result.
+    def evaluate(getter, region, *inputs):
+        local = checks.child(region=region)
+        if cache is None:
+            result = run(getter, region, inputs, local)
+        else:
+            key = cache.key(
+                network_digest,
+                getter_digest(getter),
+                region,
+                *map(frame_digest, inputs),
+            )
+            cached = cache.get(key)
+            if cached is None:
+                result = run(getter, region, inputs, local)
+                cache.put(key, (result, local.checks))
+            else:
+                result, cached_checks = cached
+                local.checks = [
+                    {**check, **local.labels} for check in cached_checks
+                ]
+        checks.checks.extend(local.checks)
+        return result
+
+    var = pd.concat({
+        region: pd.concat([
+            evaluate(get_capacities_electricity, region),
+            evaluate(get_capacities_heat, region),
+            evaluate(get_capacities_other, region),
+            evaluate(get_primary_energy, region),
+            evaluate(get_secondary_energy, region),
+            evaluate(
+                get_final_energy, region, industry_demand, energy_totals,
+            ),
+            #evaluate(get_prices, region), 
+            #get_emissions
+        ]) for region in regions
+    }, axis=1, names=["Region"])
+
+    # Fill in missing parents and check the existing ones against the sum
+    # of their children
+    report = []
+    var = aggregate(var, report=report)
+    if report:
+        checks.add_aggregation_report(pd.concat(report, ignore_index=True))
+
+    if loaded:
+        print(loaded["stats"].summary())
+    if cache is not None:
+        print(cache.summary())
+
+    # Variable x Region
+    return var
 
 
-    return var
+# uses the global variables model and var2unit. For now.
+# Networks of this process, evicted once they exceed the memory budget
+networks = NetworkPool()
+
+
+def get_data(
+    scenario_i, year, regions, sidecar=False, cache=None, memory_budget=0,
+    time_resolution=None, snapshot_chunk=None,
+):
+    scenario = get_scenario_name(scenario_i)
+    print("Evaluating scenario ", scenario, ", year ", year, ".", sep="")
+    # Only reads the time series the getters need from the NetCDF file
+    path = get_network_path(scenario_i, year)
+    reset_peak_memory()
+    networks.max_memory = memory_budget
+    # The time-resolved export needs the power time series, which are not
+    # read if the annual sums come from a sidecar. With snapshot_chunk, the
+    # annual sums are computed chunk by chunk on loading, see _network.py.
+    # With a result cache, the network is only loaded if a getter is not
+    # cached.
+    def load():
+        return networks.get(
+            path,
+            sidecar=sidecar and time_resolution is None,
+            chunk_size=snapshot_chunk,
+        )
+    # Both are read once per process and run, see _inputs.py
+    energy_totals = load_energy_totals()
+    industry_demand = load_industry_demand(
+        scenario_i["simpl"], scenario_i["clusters"], year,
+    )
+    checks = Validator(scenario=scenario, year=year)
+    var = get_ariadne_var(
+        load,
+        industry_demand,
+        energy_totals,
+        regions,
+        cache=cache,
+        network_digest=None if cache is None else file_digest(path),
+        checks=checks,
+    )
 
+    # Registered variables per month, season, ... next to the annual values
+    # of all variables, see _timeseries.py
+    if time_resolution is not None:
+        var_t = get_registered_t(load(), time_resolution, snapshot_chunk)
+        var = pd.concat([
+            pd.concat({"Year": var}, axis=1, names=["Subannual"]).swaplevel(
+                axis=1,
+            ),
+            var_t.loc[:, var_t.columns.get_level_values("Region").isin(
+                var.columns
+            )],
+        ], axis=1).sort_index(axis=1, level="Region", sort_remaining=False)
+
+    # Region-major long format
+    values = var.unstack()
+    if time_resolution is not None:
+        # Only registered variables are time-resolved
+        values = values[
+            values.notna()
+            | (values.index.get_level_values("Subannual") == "Year")
+        ]
+    variables = values.index.get_level_values(-1)
+    units = var2unit.reindex(var.index)
+    missing = units.index[units.isna()]
+    if not missing.empty:
+        print(
+            "Warning: Variables not in Ariadne Database:",
+            *missing.unique(),
+            sep="\n  ",
+        )
 
-# uses the global variables model, scenario and var2unit. For now.
-def get_data(year,):
-    print("Evaluating year ", year, ".", sep="")
-    n = pypsa.Network(f"results/{config['run']['name'][0]}/postnetworks/{scenario}{year}.nc")
-    industry_demand = pd.read_csv(
-        "resources/industrial_energy_demand_elec_s{simpl}_{clusters}_{year}.csv".format(
-            year=year, 
-            **permutations_dicts[0],
-        ), 
-        index_col="TWh/a (MtCO2/a)",
-    ).multiply(TWh2PJ)
-    industry_demand.index.name = "bus"
-    energy_totals = pd.read_csv(
-    "resources/energy_totals.csv",
-    index_col=0,
-).multiply(TWh2PJ)
-    var = get_ariadne_var(n, industry_demand, energy_totals, "DE")
-
-    data = []
-    for v in var.index:
-        try:
-            unit = var2unit[v]
-        except KeyError:
-            print("Warning: Variable '", v, "' not in Ariadne Database")
-            unit = "NA"
-
-        data.append([
-            model, 
-            scenario,
-            "DE",
-            v,
-            unit,
-            var[v],
-        ])
-
-    tab = pd.DataFrame(
-        data, 
-        columns=["Model", "Scenario", "Region", "Variable", "Unit", year]
+    arrays = [
+        np.full(len(variables), model),
+        np.full(len(variables), scenario),
+        values.index.get_level_values("Region"),
+        variables,
+        units.fillna("NA").reindex(variables).values,
+    ]
+    names = ["Model", "Scenario", "Region", "Variable", "Unit"]
+    if time_resolution is not None:
+        arrays.append(values.index.get_level_values("Subannual"))
+        names.append("Subannual")
+    index = pd.MultiIndex.from_arrays(arrays, names=names)
+
+    print(
+        f"Peak memory of scenario {scenario}, year {year}: "
+        f"{get_peak_memory() / 2**20:.0f} MB"
     )
+    print(networks.summary())
 
-    return tab
+    # Values of one year, indexed by Model x Scenario x Region x Variable x Unit
+    # (x Subannual), and the checks of all getters
+    return (
+        pd.Series(values.values, index=index, name=year),
+        checks.report(),
+    )
 
 # %%
 # costs = pd.read_csv(
@@ -142,50 +384,151 @@ def get_data(year,):
 
 
 # "2040", "2045", "2050", "2060", "2070", "2080", "2090", "2100"])
-n = n20 = pypsa.Network(f"results/{config['run']['name'][0]}/postnetworks/{scenario}{2020}.nc")
-
-
-n30 = pypsa.Network(f"results/{config['run']['name'][0]}/postnetworks/{scenario}{2030}.nc")
 
-n40 = pypsa.Network(f"results/{config['run']['name'][0]}/postnetworks/{scenario}{2040}.nc")
 
-n50 = pypsa.Network(f"results/{config['run']['name'][0]}/postnetworks/{scenario}{2050}.nc")
+def load_debug_session(year, region="DE", scenario_i=None):
+    """
+    Everything needed to try out the getters by hand for one network, e.g.
+    `get_secondary_energy(n, region, stats=stats)`. Only this network is
+    loaded, and only when asked for.
+    """
+    if scenario_i is None:
+        scenario_i = permutations_dicts[0]
+    n = load_network(get_network_path(scenario_i, year), series=None)
+    return {
+        "n": n,
+        "stats": CachedStatistics(n),
+        "kwargs": {
+            'groupby': n.statistics.groupers.get_name_bus_and_carrier,
+            'nice_names': False,
+        },
+        "year": year,
+        "region": region,
+        "industry_demand": load_industry_demand(
+            scenario_i["simpl"], scenario_i["clusters"], year,
+        ),
+        "energy_totals": load_energy_totals(),
+    }
 
-kwargs = {
-    'groupby': n.statistics.groupers.get_name_bus_and_carrier,
-    'nice_names': False,
-}
-year=2020
-region="DE"
-industry_demand = pd.read_csv(
-    "resources/industrial_energy_demand_elec_s{simpl}_{clusters}_{year}.csv".format(
-        year=year, 
-        **permutations_dicts[0],
-    ), 
-    index_col="TWh/a (MtCO2/a)",
-).multiply(TWh2PJ)
-
-energy_totals = pd.read_csv(
-    "resources/energy_totals.csv",
-    index_col=0,
-).multiply(TWh2PJ)
 # %%
 
+def get_batch_data(
+    permutations_dicts, years, regions=["DE"], workers=1,
+    sidecar=False, cache=None, writer=None, memory_budget=0,
+    time_resolution=None, snapshot_chunk=None,
+):
+    # Regions of a work item which still have to be evaluated. Without a
+    # writer, or if it starts from scratch, that is all of them.
+    def remaining(scenario_i, year):
+        if writer is None:
+            return regions
+        written = writer.written(get_scenario_name(scenario_i), year)
+        if regions == "all" or regions == ["all"]:
+            # The regions of a work item are written together
+            return [] if written else regions
+        return [region for region in regions if region not in written]
+
+    work_items = [
+        (scenario_i, year, todo)
+        for scenario_i, year in product(permutations_dicts, years)
+        if (todo := remaining(scenario_i, year))
+    ]
+    skipped = len(permutations_dicts) * len(years) - len(work_items)
+    if skipped:
+        print(f"Skipping {skipped} (scenario, year) pairs already written.")
+
+    # All (scenario, year) pairs are independent of each other, so they can
+    # be evaluated in separate processes. Executor.map returns the results
+    # in the order of the work items, no matter which process finishes first.
+    data = partial(
+        get_data,
+        sidecar=sidecar,
+        cache=cache,
+        memory_budget=memory_budget,
+        time_resolution=time_resolution,
+        snapshot_chunk=snapshot_chunk,
+    )
+    tabs, reports = [], []
+
+    # Every result is written as soon as it arrives, such that a crash only
+    # loses the work items that are still running
+    def collect(results):
+        for tab, report in results:
+            if writer is None:
+                tabs.append(tab)
+            else:
+                writer.write(tab)
+            reports.append(report)
+
+    if workers > 1 and len(work_items) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(work_items))
+        ) as pool:
+            collect(pool.map(data, *zip(*work_items)))
+    else:
+        collect(data(*item) for item in work_items)
+
+    if writer is not None:
+        df = writer.close()
+    else:
+        # Stack the scenarios of every year and put the years side by side
+        # in a single concat, instead of merging the tables year by year
+        yearly = {}
+        for tab in tabs:
+            yearly.setdefault(tab.name, []).append(tab)
+
+        df = pd.concat(
+            {year: pd.concat(tabs) for year, tabs in yearly.items()},
+            axis=1,
+            sort=False,
+        ).reset_index()
+
+    if reports:
+        report = pd.concat(reports, ignore_index=True)
+    else:
+        report = Validator().report()
+    return df, report
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+
+    if args.interactive:
+        # The session's variables become globals of the script, such that
+        # getters and helpers can be called on them right away
+        session = load_debug_session(
+            args.year or years[0], region=args.regions[0],
+        )
+        globals().update(session)
+        print("Loaded", *session, sep="\n  ")
+        return
+
+    df, report = get_batch_data(
+        permutations_dicts,
+        years,
+        regions=args.regions,
+        workers=args.workers,
+        sidecar=args.sidecar,
+        cache=None if args.no_cache else ResultCache(
+            args.cache_dir, max_size=args.cache_size * 2**20,
+        ),
+        writer=IamcWriter(
+            args.output, resume=args.resume, variables=template.index,
+        ),
+        memory_budget=args.memory_budget * 2**20,
+        time_resolution=args.time_resolution,
+        snapshot_chunk=args.snapshot_chunk,
+    )
 
-yearly_dfs = map(get_data, years)
-
-df = reduce(
-    lambda left, right: pd.merge(
-        left, 
-        right, 
-        on=["Model", "Scenario", "Region", "Variable", "Unit"]), 
-    yearly_dfs
-) # directly use pd.merge?
+    report.to_csv(
+        Path(args.output).with_name("pypsa_validation.csv"),
+        index=False
+    )
+    print(summarize(report))
 
 
-df.to_csv(
-    "/home/micha/git/pypsa-exporter/pypsa_output.csv",
-    index=False
-)
+# Guard the export, such that worker processes which re-import this
+# script (spawn start method) do not start exporting themselves
+if __name__ == "__main__":
+    main()
 # !: Check for integer zeros in the xlsx-file. They may indicate missing
 # technologies
@@ -0,0 +1,60 @@
+"""
+Checks the annual sums of _statistics.py and _utils.py against
+``n.statistics`` on the PyPSA example networks, which are downloaded and
+solved (with HiGHS) on first use. Run with ``pytest``.
+"""
+import numpy as np
+import pandas as pd
+import pypsa
+import pytest
+from pypsa.statistics import get_name_bus_and_carrier
+
+from _statistics import (
+    CachedStatistics, get_curtailed_energy, get_port_energies,
+)
+from _utils import get_weighted_sums
+
+
+KWARGS = {
+    "groupby": get_name_bus_and_carrier,
+    "nice_names": False,
+    "aggregate_time": "sum",
+}
+
+
+@pytest.fixture(scope="module", params=["ac_dc_meshed", "storage_hvdc"])
+def n(request):
+    n = getattr(pypsa.examples, request.param)()
+    n.optimize(solver_name="highs")
+    return n
+
+
+@pytest.mark.parametrize("metric", ["supply", "withdrawal", "curtailment"])
+@pytest.mark.parametrize("bus_carrier", [None, "AC"])
+def test_balance_matches_statistics(n, metric, bus_carrier):
+    stats = CachedStatistics(n)
+    # Answered from the energy balance, not passed on to n.statistics
+    assert stats._from_balance(metric, bus_carrier, KWARGS) is not None
+
+    actual = getattr(stats, metric)(bus_carrier=bus_carrier, **KWARGS)
+    expected = getattr(n.statistics, metric)(
+        bus_carrier=bus_carrier, **KWARGS,
+    )
+    # n.statistics also lists the assets without energy
+    actual, expected = actual.align(expected, fill_value=0)
+    pd.testing.assert_series_equal(actual, expected, check_names=False)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7])
+def test_chunked_sums(n, chunk_size):
+    chunked = n.copy()
+    for get_sums in [get_weighted_sums, get_port_energies, get_curtailed_energy]:
+        expected = get_sums(n)
+        actual = get_sums(chunked, chunk_size)
+        assert actual.keys() == expected.keys()
+        for key in expected:
+            assert actual[key].index.equals(expected[key].index)
+            # Chunks add up in a different order
+            np.testing.assert_allclose(
+                actual[key], expected[key], rtol=1e-9, atol=1e-6,
+            )